@@ -0,0 +1,130 @@
+"""
+ASGI entry point: the async lookup endpoints are served natively on the event loop,
+every other route is delegated to the Flask application.
+
+    gunicorn -w $THREADS -k uvicorn.workers.UvicornWorker -b 0.0.0.0:5000 asgi:app
+"""
+import json
+import traceback
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from model.data_retrievers.async_lookup_retriever import AsyncLookupRetriever
+from model.utils import build_error
+from server import app as flask_app
+from server import database, lookup_retriever, params_validator
+
+async_lookup_retriever = AsyncLookupRetriever(lookup_retriever)
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def get_args(scope):
+    query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    return {key: values[0] for key, values in query.items()}
+
+
+async def lookup(scope, receive):
+    args = get_args(scope)
+
+    token_is_valid, token_error = params_validator.validate_token(args.get("token"))
+    if not token_is_valid:
+        return token_error
+
+    is_fuzzy_valid, fuzzy_value = params_validator.validate_bool(args.get("fuzzy"))
+    if not is_fuzzy_valid:
+        return fuzzy_value
+
+    kg_is_valid, kg_error_or_value = params_validator.validate_kg(database, args.get("kg"))
+    if not kg_is_valid:
+        return kg_error_or_value
+
+    limit_is_valid, limit_error_or_value = params_validator.validate_limit(args.get("limit"))
+    if not limit_is_valid:
+        return limit_error_or_value
+
+    name = args.get("name")
+    if name is None:
+        return build_error("Name is not defined", 400)
+
+    try:
+        results = await async_lookup_retriever.search(name, limit=limit_error_or_value, kg=kg_error_or_value,
+                                                      fuzzy=fuzzy_value, types=args.get("types"), ids=args.get("ids"))
+    except Exception as e:
+        return build_error(f"Elastic error: {str(e)}", 400, traceback=traceback.format_exc())
+
+    return results, 200
+
+
+async def lookup_batch(scope, receive):
+    args = get_args(scope)
+
+    token_is_valid, token_error = params_validator.validate_token(args.get("token"))
+    if not token_is_valid:
+        return token_error
+
+    kg_is_valid, kg_error_or_value = params_validator.validate_kg(database, args.get("kg"))
+    if not kg_is_valid:
+        return kg_error_or_value
+
+    try:
+        data = json.loads(await read_body(receive))["json"]
+    except Exception:
+        return build_error("Invalid json format", 400)
+
+    cells_are_valid, cells_error_or_value = params_validator.validate_lookup_cells(data)
+    if not cells_are_valid:
+        return cells_error_or_value
+
+    try:
+        results = await async_lookup_retriever.search_batch(cells_error_or_value, kg=kg_error_or_value)
+    except Exception as e:
+        return build_error(f"Elastic error: {str(e)}", 400, traceback=traceback.format_exc())
+
+    return results, 200
+
+
+routes = {
+    ("GET", "/async/lookup/entity-retrieval"): lookup,
+    ("POST", "/async/lookup/entity-retrieval-batch"): lookup_batch,
+}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_lookup_retriever.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    route = routes.get((scope.get("method"), scope.get("path")))
+    if scope["type"] != "http" or route is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    payload, status = await route(scope, receive)
+    await send_json(send, payload, status)
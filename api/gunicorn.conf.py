@@ -0,0 +1,40 @@
+import argparse
+import gc
+import os
+import shlex
+import sys
+
+# With GUNICORN_PRELOAD=true the app (and the spaCy models) is loaded once in the master and the
+# workers share its memory copy-on-write. Not compatible with --reload.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "false").lower() == "true"
+
+
+def command_line_worker_class():
+    # the worker class of the command line (or GUNICORN_CMD_ARGS), which overrides this file
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-k", "--worker-class", default="sync")
+    args = shlex.split(os.environ.get("GUNICORN_CMD_ARGS", "")) + sys.argv[1:]
+    return parser.parse_known_args(args)[0].worker_class
+
+
+if preload_app and "gevent" in command_line_worker_class():
+    # the app is imported here, before the gevent worker patches itself: without patching first, the
+    # locks, semaphores and thread pools created at import would be OS primitives blocking the whole hub
+    from gevent import monkey
+
+    monkey.patch_all()
+
+
+def pre_fork(server, worker):
+    # the objects of the preloaded app are moved out of the gc generations, so that the
+    # collections in the workers do not write to (and copy) their pages
+    if preload_app:
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # runs in the worker after the gevent patching, the Mongo and Elasticsearch clients are created here
+    if preload_app:
+        import server as lamapi
+
+        lamapi.start_warm_up()
@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from model.utils import compute_ambiguity
+
+CANDIDATE_CACHE_ENABLED = os.environ.get("CANDIDATE_CACHE_ENABLED", "true").lower() == "true"
+# Seconds after the last access before MongoDB drops a cache entry
+CANDIDATE_CACHE_TTL = int(os.environ.get("CANDIDATE_CACHE_TTL", 30 * 24 * 3600))
+# Max number of entries per cache collection, the least recently accessed ones are evicted first
+CANDIDATE_CACHE_MAX_SIZE = int(os.environ.get("CANDIDATE_CACHE_MAX_SIZE", 1000000))
+# Access times of hits are written in batches, when enough are pending or the interval has elapsed
+CANDIDATE_CACHE_TOUCH_BATCH = int(os.environ.get("CANDIDATE_CACHE_TOUCH_BATCH", 500))
+CANDIDATE_CACHE_TOUCH_INTERVAL = int(os.environ.get("CANDIDATE_CACHE_TOUCH_INTERVAL", 30))
+# Number of inserts between two checks of the collection size
+CANDIDATE_CACHE_EVICTION_CHECK = int(os.environ.get("CANDIDATE_CACHE_EVICTION_CHECK", 1000))
+# The unique key index is built after removing the duplicates of older entries, again if other workers
+# wrote new ones in the meantime
+CANDIDATE_CACHE_DEDUPE_ATTEMPTS = 3
+CANDIDATE_CACHE_DEDUPE_BATCH = 10000
+
+# an entry holds the candidates of the largest limit looked up so far, and serves every smaller limit.
+# The ids are part of the key (as in the L1 key): the hits of the ids query are added to the candidates
+KEY_FIELDS = ("cell", "type", "kg", "fuzzy", "ids")
+KEY_INDEX = [("cell", 1), ("fuzzy", 1), ("type", 1), ("kg", 1), ("ids", 1)]
+# unique index of the previous key, with the limit
+LEGACY_KEY_INDEX = "cell_1_fuzzy_1_type_1_kg_1_limit_1"
+# candidates of the main query depend on the limit, the ones of the ids query and of the fallback tiers do not
+LIMITED_TIERS = ("exact", "fuzzy")
+ENTRY_FIELDS = ("limit", "candidates", "hit_positions", "first_positions", "hit_scores", "token_hits")
+
+
+def hit_positions(lookup, candidates):
+    # position among the main query hits of the hit each candidate was built from, and of the first hit
+    # of the same entity (None for the candidates not cut by the limit), with the es_score of the main
+    # query hits, to truncate the candidates as the ES query would
+    main_hits = [hit for hit in lookup.get("hits", []) if hit.get("tier") in LIMITED_TIERS]
+    first = {}
+    for i, hit in enumerate(main_hits):
+        first.setdefault(hit["id"], i)
+    other = {hit["id"] for hit in lookup.get("hits", []) if hit.get("tier") not in LIMITED_TIERS}
+    positions, first_positions = [], []
+    for candidate, index in zip(candidates, lookup["candidate_hits"]):
+        limited = candidate["id"] not in other
+        # the main query hits come first in the hits of the lookup
+        positions.append(index if limited else None)
+        first_positions.append(first.get(candidate["id"]) if limited else None)
+    return positions, first_positions, [hit["es_score"] for hit in main_hits]
+
+
+def truncate_candidates(document, limit):
+    # candidates of a lookup with a smaller limit: the ones found by the main query only in its hits
+    # after the first `limit` are dropped, pos_score and the ambiguity statistics are computed again.
+    # None when the entry cannot serve the limit: a candidate built from a later hit of its entity than
+    # the first one would be built from another hit
+    candidates = document["candidates"]
+    if document.get("limit", limit) <= limit:
+        return candidates
+    if document.get("hit_positions") is None:
+        # entries written before the hit positions were stored
+        return candidates[:limit]
+
+    n_hits = min(len(document["hit_scores"]), limit)
+    max_es_score = max(document["hit_scores"][:limit], default=0) or 1
+    ambiguity = None
+    if document.get("token_hits") is not None:
+        ambiguity = compute_ambiguity(document["cell"], document["token_hits"][:limit])
+
+    truncated = []
+    for candidate, position, first in zip(candidates, document["hit_positions"], document["first_positions"]):
+        if position is not None:
+            if first >= limit:
+                continue
+            if position >= limit:
+                return None
+            candidate = dict(
+                candidate,
+                pos_score=round((position + 1) / n_hits, 3),
+                es_score=round(document["hit_scores"][position] / max_es_score, 3),
+            )
+        if ambiguity is not None:
+            candidate = dict(candidate, ambiguity_mention=ambiguity[0], corrects_tokens=ambiguity[1])
+        truncated.append(candidate)
+    return truncated
+
+
+def remove_duplicates(collection):
+    # keeps, for every key, the entry with the largest limit and deletes the others; the key fields
+    # missing from older entries count as null, as in the unique index
+    groups = collection.aggregate([
+        {"$sort": {"limit": -1}},
+        {"$group": {
+            "_id": {field: {"$ifNull": [f"${field}", None]} for field in KEY_FIELDS},
+            "entries": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    removed = 0
+    duplicates = []
+    for group in groups:
+        duplicates.extend(group["entries"][1:])
+        if len(duplicates) >= CANDIDATE_CACHE_DEDUPE_BATCH:
+            removed += collection.delete_many({"_id": {"$in": duplicates}}).deleted_count
+            duplicates = []
+    if len(duplicates) > 0:
+        removed += collection.delete_many({"_id": {"$in": duplicates}}).deleted_count
+    return removed
+
+
+class CandidateCache:
+
+    def __init__(self, database, ttl=CANDIDATE_CACHE_TTL, max_size=CANDIDATE_CACHE_MAX_SIZE):
+        self.database = database
+        self.ttl = ttl
+        self.max_size = max_size
+        self._initialized = set()
+        self._pending_touches = {}
+        self._last_flush = time.monotonic()
+        self._inserts_since_check = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "inserts": 0, "upgrades": 0, "duplicates": 0, "evictions": 0}
+
+    def get_collection(self, kg):
+        collection = self.database.get_requested_collection("cache", kg=kg)
+        if collection.full_name not in self._initialized:
+            self._create_indexes(collection)
+            self._initialized.add(collection.full_name)
+        return collection
+
+    def _create_indexes(self, collection):
+        # entries used to be keyed by limit too: the old index goes (every worker does it, the index
+        # may already be gone)
+        if LEGACY_KEY_INDEX in collection.index_information():
+            self._drop_index(collection, LEGACY_KEY_INDEX)
+        for attempt in range(CANDIDATE_CACHE_DEDUPE_ATTEMPTS):
+            try:
+                collection.create_index(KEY_INDEX, unique=True)
+                break
+            except DuplicateKeyError:
+                # a key cached with several limits: the largest one serves the others
+                if attempt == CANDIDATE_CACHE_DEDUPE_ATTEMPTS - 1:
+                    raise
+                removed = remove_duplicates(collection)
+                print(f"Removed {removed} smaller-limit duplicates from {collection.full_name}", flush=True)
+        try:
+            collection.create_index([("lastAccessed", 1)], expireAfterSeconds=self.ttl)
+        except OperationFailure:
+            # an index on lastAccessed already exists (plain or with another TTL): turn it into the TTL index
+            collection.database.command(
+                "collMod", collection.name, index={"keyPattern": {"lastAccessed": 1}, "expireAfterSeconds": self.ttl}
+            )
+
+    def _drop_index(self, collection, name):
+        try:
+            collection.drop_index(name)
+        except OperationFailure as e:
+            # IndexNotFound: dropped by another worker in the meantime
+            if e.code != 27 and "index not found" not in str(e):
+                raise
+
+    def get(self, lookup):
+        collection = self.get_collection(lookup["kg"])
+        key = {field: lookup[field] for field in KEY_FIELDS}
+        key["limit"] = {"$gte": lookup["limit"]}
+        result = collection.find_one(key, {"cell": 1, **{field: 1 for field in ENTRY_FIELDS}})
+        if result is None:
+            self._count("misses")
+            return None
+
+        candidates = truncate_candidates(result, lookup["limit"])
+        if candidates is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        self._touch(collection, [result["_id"]])
+        return candidates
+
+    def get_many(self, lookups, kg):
+        # resolves the cached lookups of a batch with a single query, keyed by position in lookups
+        if len(lookups) == 0:
+            return {}
+        collection = self.get_collection(kg)
+        keys = [tuple(lookup[field] for field in KEY_FIELDS) for lookup in lookups]
+        min_limits = {}
+        for key, lookup in zip(keys, lookups):
+            min_limits[key] = min(min_limits.get(key, lookup["limit"]), lookup["limit"])
+        query = {
+            "$or": [dict(zip(KEY_FIELDS, key), limit={"$gte": min_limit}) for key, min_limit in min_limits.items()]
+        }
+        found = {}
+        projection = {field: 1 for field in KEY_FIELDS + ENTRY_FIELDS}
+        for result in collection.find(query, projection):
+            found[tuple(result.get(field) for field in KEY_FIELDS)] = result
+
+        cached = {}
+        for i, key in enumerate(keys):
+            if key in found and found[key]["limit"] >= lookups[i]["limit"]:
+                candidates = truncate_candidates(found[key], lookups[i]["limit"])
+                if candidates is not None:
+                    cached[i] = candidates
+        self._count("hits", len(cached))
+        self._count("misses", len(lookups) - len(cached))
+        self._touch(collection, [result["_id"] for result in found.values()])
+        return cached
+
+    def put(self, lookup, candidates, query=None):
+        # inserts the entry, or upgrades in place an entry of a smaller limit; an entry of a
+        # larger limit is kept (the filter does not match it and the upsert hits the unique index)
+        collection = self.get_collection(lookup["kg"])
+        key = {field: lookup[field] for field in KEY_FIELDS}
+        document = {"limit": lookup["limit"], "candidates": candidates, "lastAccessed": datetime.utcnow(), "query": query}
+        if "candidate_hits" in lookup:
+            document["hit_positions"], document["first_positions"], document["hit_scores"] = hit_positions(
+                lookup, candidates
+            )
+        if lookup.get("token_hits") is not None:
+            document["token_hits"] = [{"id": hit["id"], "name": hit["name"]} for hit in lookup["token_hits"]]
+        update = {"$set": document}
+        stale = {field: "" for field in ENTRY_FIELDS if field not in document}
+        if len(stale) > 0:
+            update["$unset"] = stale
+        try:
+            result = collection.update_one(dict(key, limit={"$lt": lookup["limit"]}), update, upsert=True)
+        except DuplicateKeyError:
+            self._count("duplicates")
+            return
+        if result.upserted_id is None:
+            self._count("upgrades")
+            return
+        self._count("inserts")
+
+        with self._lock:
+            self._inserts_since_check += 1
+            check = self._inserts_since_check >= CANDIDATE_CACHE_EVICTION_CHECK
+            if check:
+                self._inserts_since_check = 0
+        if check:
+            self.evict(collection)
+
+    def evict(self, collection):
+        excess = collection.estimated_document_count() - self.max_size
+        if excess <= 0:
+            return
+        # pending access times must be written first, otherwise hot entries look stale
+        self.flush()
+        oldest = collection.find({}, {"_id": 1}).sort("lastAccessed", 1).limit(excess)
+        ids = [result["_id"] for result in oldest]
+        if len(ids) > 0:
+            deleted = collection.delete_many({"_id": {"$in": ids}}).deleted_count
+            self._count("evictions", deleted)
+
+    def _touch(self, collection, ids):
+        with self._lock:
+            pending = self._pending_touches.setdefault(collection.full_name, (collection, set()))[1]
+            pending.update(ids)
+            n_pending = sum(len(touches) for _, touches in self._pending_touches.values())
+            due = time.monotonic() - self._last_flush >= CANDIDATE_CACHE_TOUCH_INTERVAL
+        if n_pending >= CANDIDATE_CACHE_TOUCH_BATCH or due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending_touches = self._pending_touches
+            self._pending_touches = {}
+            self._last_flush = time.monotonic()
+        now = datetime.utcnow()
+        for collection, ids in pending_touches.values():
+            collection.update_many({"_id": {"$in": list(ids)}}, {"$set": {"lastAccessed": now}})
+
+    def _count(self, stat, value=1):
+        with self._lock:
+            self.stats[stat] += value
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups > 0 else 0
+        return stats
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from model.l1_cache import LocalLRUCache, make_key
+
+COLUMN_CACHE_ENABLED = os.environ.get("COLUMN_CACHE_ENABLED", "true").lower() == "true"
+# Byte budget of the results kept in memory by each worker
+COLUMN_CACHE_MAX_BYTES = int(os.environ.get("COLUMN_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# Also keep the results in the "column_cache" collection of COLUMN_CACHE_DB, shared by the workers
+COLUMN_CACHE_MONGO = os.environ.get("COLUMN_CACHE_MONGO", "false").lower() == "true"
+COLUMN_CACHE_DB = os.environ.get("COLUMN_CACHE_DB", "lamapi")
+COLUMN_CACHE_TTL = int(os.environ.get("COLUMN_CACHE_TTL", 30 * 24 * 3600))
+
+# Bumped when the column classification changes, so that the results of the previous one are not used
+CLASSIFIER_VERSION = 1
+
+
+class ColumnCache:
+    # Column analysis results keyed by a hash of the cells of the column, together with what the
+    # decision also depends on (the number of rows of the table and the sampling mode)
+
+    def __init__(self, database, max_bytes=COLUMN_CACHE_MAX_BYTES, use_mongo=COLUMN_CACHE_MONGO, ttl=COLUMN_CACHE_TTL):
+        self.database = database
+        self.local = LocalLRUCache(max_bytes)
+        self.use_mongo = use_mongo
+        self.ttl = ttl
+        self._collection = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "mongo_hits": 0, "misses": 0, "errors": 0}
+
+    def key(self, column, rows, sample):
+        digest = hashlib.sha256(json.dumps(column, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return make_key("column", CLASSIFIER_VERSION, rows, bool(sample), digest)
+
+    def get_collection(self):
+        if self._collection is None:
+            collection = self.database.mongo[COLUMN_CACHE_DB]["column_cache"]
+            try:
+                collection.create_index([("createdAt", 1)], expireAfterSeconds=self.ttl)
+            except OperationFailure:
+                collection.database.command(
+                    "collMod", collection.name, index={"keyPattern": {"createdAt": 1}, "expireAfterSeconds": self.ttl}
+                )
+            self._collection = collection
+        return self._collection
+
+    def get_many(self, keys):
+        results = {}
+        missing = []
+        for key in set(keys):
+            result = self.local.get(key)
+            if result is not None:
+                results[key] = result
+            else:
+                missing.append(key)
+        hits, mongo_hits = len(results), 0
+
+        if self.use_mongo and len(missing) > 0:
+            try:
+                for document in self.get_collection().find({"_id": {"$in": missing}}):
+                    results[document["_id"]] = document["result"]
+                    self.local.put(document["_id"], document["result"])
+                    mongo_hits += 1
+            except PyMongoError:
+                self._count("errors")
+
+        with self._lock:
+            self.stats["hits"] += hits
+            self.stats["mongo_hits"] += mongo_hits
+            self.stats["misses"] += len(missing) - mongo_hits
+        return results
+
+    def put_many(self, results):
+        for key, result in results.items():
+            self.local.put(key, result)
+        if self.use_mongo and len(results) > 0:
+            now = datetime.utcnow()
+            try:
+                self.get_collection().bulk_write([
+                    UpdateOne({"_id": key}, {"$set": {"result": result, "createdAt": now}}, upsert=True)
+                    for key, result in results.items()
+                ], ordered=False)
+            except PyMongoError:
+                self._count("errors")
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["local"] = self.local.get_stats()
+        stats["mongo"] = self.use_mongo
+        return stats
@@ -0,0 +1,250 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Processes of the CPU pool (candidate scoring, literal classification), 0 runs the work in the worker
+CPU_POOL_SIZE = int(os.environ.get("CPU_POOL_SIZE", 2))
+# Calls submitted and not finished yet, the next callers wait for a free slot
+CPU_POOL_MAX_PENDING = int(os.environ.get("CPU_POOL_MAX_PENDING", 64))
+# Smaller calls run in the worker, where they cost less than the round trip to the pool
+CPU_OFFLOAD_MIN_ITEMS = int(os.environ.get("CPU_OFFLOAD_MIN_ITEMS", 500))
+
+
+class RemoteTraceback(Exception):
+    # carries the traceback of an exception raised in a pool process
+
+    def __str__(self):
+        return self.args[0]
+
+
+def _serve(calls, results, initializer):
+    # loop of a pool process: runs the calls received on its pipe and sends back their results, the
+    # start time gives the time spent in the queue. It ends when the pipe is closed.
+    if initializer is not None:
+        try:
+            initializer()
+        except Exception:
+            traceback.print_exc()
+            return
+    while True:
+        try:
+            function, args = calls.recv()
+        except EOFError:
+            return
+        started = time.time()
+        try:
+            response = (True, function(*args), None, started, time.time() - started)
+        except Exception as e:
+            response = (False, e, traceback.format_exc(), started, time.time() - started)
+        try:
+            results.send(response)
+        except Exception as e:
+            # the result or the exception cannot be pickled
+            results.send((False, RuntimeError(repr(e)), traceback.format_exc(), started, time.time() - started))
+
+
+def gevent_patched():
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+class PoolProcess:
+    # a pool process and its pipes: one-way pipes are plain blocking file descriptors, while the two-way
+    # ones are sockets, which gevent makes non-blocking
+
+    def __init__(self, name, initializer):
+        context = multiprocessing.get_context("spawn")
+        calls, self.calls = context.Pipe(duplex=False)
+        self.results, results = context.Pipe(duplex=False)
+        self.process = context.Process(target=_serve, args=(calls, results, initializer), name=name, daemon=True)
+        self.process.start()
+        calls.close()
+        results.close()
+
+    def stop(self):
+        self.calls.close()
+        self.results.close()
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class CpuExecutor:
+    # Runs CPU-bound functions on a bounded pool of processes (spawned, so they do not inherit the
+    # worker's clients and gevent state). Each process has its own pipe, written and read by one of
+    # as many native threads: under gevent's monkey patching these are the threads of the hub's
+    # threadpool, and the callers wait on them cooperatively. A greenlet blocked on a pipe would stop
+    # the whole hub, and the processes would wait forever for their results to be read.
+    # The functions and their arguments must be picklable (module-level functions).
+
+    def __init__(self, name, size=CPU_POOL_SIZE, max_pending=CPU_POOL_MAX_PENDING,
+                 min_items=CPU_OFFLOAD_MIN_ITEMS, initializer=None):
+        self.name = name
+        self.size = size
+        self.min_items = min_items
+        self.initializer = initializer
+        self._threads = None
+        self._cooperative = False
+        self._processes = []
+        self._idle = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "inline": 0, "failed": 0, "pending": 0, "max_pending": 0}
+        self.timings = {
+            stage: {"count": 0, "total_ms": 0.0, "max_ms": 0.0} for stage in ("queue_wait", "run", "total")
+        }
+
+    def _start(self):
+        # the threads and the processes are started on first use, dead processes are replaced; a forked
+        # worker (gunicorn preload) starts its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._threads, self._processes, self._idle = None, [], []
+                self._pid = os.getpid()
+            if self._threads is None:
+                self._cooperative = gevent_patched()
+                if self._cooperative:
+                    from gevent.threadpool import ThreadPool
+
+                    self._threads = ThreadPool(self.size)
+                else:
+                    self._threads = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=self.name)
+            while len(self._processes) < self.size:
+                process = PoolProcess(f"{self.name}-{len(self._processes)}", self.initializer)
+                self._processes.append(process)
+                self._idle.append(process)
+            return self._threads
+
+    def _call(self, function, args):
+        # runs in a native thread: there are as many threads as processes, so one of them is idle
+        try:
+            process = self._idle.pop()
+        except IndexError:
+            raise BrokenProcessPool(f"No process of the {self.name} pool is running")
+        try:
+            process.calls.send((function, args))
+            ok, value, remote_traceback, started, run_s = process.results.recv()
+        except (EOFError, OSError) as e:
+            self._processes.remove(process)
+            process.stop()
+            raise BrokenProcessPool(f"A process of the {self.name} pool terminated abruptly") from e
+        except BaseException:
+            self._idle.append(process)
+            raise
+        self._idle.append(process)
+        if not ok:
+            raise value from RemoteTraceback(remote_traceback)
+        return value, started, run_s
+
+    def _submit(self, threads, function, args):
+        # returns the function waiting for the result
+        if self._cooperative:
+            return threads.spawn(self._call, function, args).get
+        return threads.submit(self._call, function, args).result
+
+    def run(self, function, *args, items=None):
+        # items: size of the work, the calls smaller than min_items are not offloaded
+        if self.size <= 0 or (items is not None and items < self.min_items):
+            with self._stats_lock:
+                self.stats["inline"] += 1
+            return function(*args)
+        return self.map(function, [args])[0]
+
+    def map(self, function, args_list):
+        # one call per args tuple, in parallel on the pool, results in order
+        args_list = list(args_list)
+        if self.size <= 0:
+            with self._stats_lock:
+                self.stats["inline"] += len(args_list)
+            return [function(*args) for args in args_list]
+
+        submitted = time.time()
+        waits = []
+        error = None
+        try:
+            threads = self._start()
+            for args in args_list:
+                self._slots.acquire()
+                try:
+                    waits.append(self._submit(threads, function, args))
+                except Exception:
+                    self._slots.release()
+                    raise
+                with self._stats_lock:
+                    self.stats["submitted"] += 1
+                    self.stats["pending"] += 1
+                    self.stats["max_pending"] = max(self.stats["max_pending"], self.stats["pending"])
+        except Exception as e:
+            error = e
+
+        # every submitted call is awaited, its slot is free only once it has finished
+        results = []
+        for wait in waits:
+            try:
+                result, started, run_s = wait()
+            except Exception as e:
+                error = error or e
+                continue
+            finally:
+                self._release()
+            self._record("queue_wait", max(started - submitted, 0))
+            self._record("run", run_s)
+            results.append(result)
+        if error is not None:
+            with self._stats_lock:
+                self.stats["failed"] += 1
+            raise error
+        self._record("total", time.time() - submitted)
+        return results
+
+    def warm_up(self):
+        # starts the pool processes before the first request
+        self.map(time.sleep, [(0,)] * self.size)
+
+    def _release(self):
+        with self._stats_lock:
+            self.stats["pending"] -= 1
+        self._slots.release()
+
+    def _record(self, stage, seconds):
+        elapsed_ms = seconds * 1000
+        with self._stats_lock:
+            stats = self.timings[stage]
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+            stats["size"] = self.size
+            stats["timings"] = {
+                stage: {
+                    "count": timing["count"],
+                    "avg_ms": round(timing["total_ms"] / timing["count"], 3) if timing["count"] > 0 else 0.0,
+                    "max_ms": round(timing["max_ms"], 3),
+                }
+                for stage, timing in self.timings.items()
+            }
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            for process in self._processes:
+                process.stop()
+            self._processes, self._idle = [], []
+            if self._threads is not None and self._pid == os.getpid():
+                if self._cooperative:
+                    self._threads.kill()
+                else:
+                    self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+
+
+cpu_executor = CpuExecutor("cpu")
@@ -0,0 +1,102 @@
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from model.database import MONGO_ENDPOINT, MONGO_PASSWORD, MONGO_PORT, MONGO_USERNAME
+from model.elastic import AsyncElastic
+
+
+class AsyncLookupRetriever:
+    # asyncio counterpart of LookupRetriever: it drives the same lookup plan (queries, caches,
+    # scoring and stats are shared), with AsyncElasticsearch for the searches and Motor for the
+    # type labels. The pymongo based candidate cache runs in a worker thread.
+
+    def __init__(self, lookup_retriever):
+        self.lookup_retriever = lookup_retriever
+        self.database = lookup_retriever.database
+        self.elastic_retriever = AsyncElastic()
+        self.mongo = AsyncIOMotorClient(
+            MONGO_ENDPOINT,
+            int(MONGO_PORT),
+            username=MONGO_USERNAME,
+            password=MONGO_PASSWORD
+        )
+
+    async def search(self, label, limit=100, kg="wikidata", fuzzy=False, types=None, ids=None):
+        lookup = self.lookup_retriever.prepare_lookup(label, limit=limit, kg=kg, fuzzy=fuzzy, types=types, ids=ids)
+
+        candidates = await asyncio.to_thread(self.lookup_retriever.get_cached_candidates, lookup)
+        if candidates is None:
+            await self._run_lookups([lookup], kg)
+            await asyncio.to_thread(self.lookup_retriever.cache_candidates, lookup)
+            candidates = lookup["candidates"]
+
+        return {lookup["cell"]: candidates}
+
+    async def search_batch(self, cells, kg="wikidata"):
+        lookups = self.lookup_retriever.prepare_lookups(cells, kg)
+
+        final_result = {}
+        pending = []
+        cached = await asyncio.to_thread(self.lookup_retriever.get_cached_many, lookups, kg)
+        for i, lookup in enumerate(lookups):
+            if i in cached:
+                final_result[lookup["cell"]] = cached[i]
+            else:
+                pending.append(lookup)
+
+        if len(pending) > 0:
+            await self._run_lookups(pending, kg)
+            for lookup in pending:
+                final_result[lookup["cell"]] = lookup["candidates"]
+            await asyncio.to_thread(self.lookup_retriever.cache_many, pending, kg)
+
+        return final_result
+
+    async def _run_lookups(self, lookups, kg):
+        plan = self.lookup_retriever.plan_lookups(lookups, kg)
+        request = next(plan)
+        while True:
+            kind, payload = request
+            if kind == "msearch":
+                response = await self.elastic_retriever.msearch(payload, kg)
+            elif kind == "msearch_budget":
+                searches, timeout = payload
+                response = await self.elastic_retriever.msearch(searches, kg, timeout=timeout)
+            elif kind == "ambiguity":
+                response = await self._get_ambiguity(payload, kg)
+            elif kind == "scores":
+                response = await asyncio.to_thread(self.lookup_retriever.score_candidates, payload)
+            else:
+                response = await self._get_types_id_to_name(payload, kg)
+            try:
+                request = plan.send(response)
+            except StopIteration:
+                return
+
+    def _get_db(self, kg):
+        db_name = self.database.mappings.get(kg)
+        if db_name is None:
+            raise ValueError(f"KG {kg} is not supported.")
+        return self.mongo[db_name]
+
+    async def _get_ambiguity(self, labels, kg):
+        query = self.lookup_retriever.create_ambiguity_query(labels)
+        documents = await self._get_db(kg)["ambiguity"].find(query, {"_id": 0}).to_list(length=None)
+        return self.lookup_retriever.parse_ambiguity(documents)
+
+    async def _get_types_id_to_name(self, ids, kg):
+        registry = self.lookup_retriever.type_label_registry
+        if registry is not None:
+            types_id_to_name = registry.get_labels(ids, kg)
+            if types_id_to_name is not None:
+                return types_id_to_name
+
+        cursor = self._get_db(kg)["items"].find(
+            {"category": "type", "entity": {"$in": ids}}, {"_id": 0, "entity": 1, "labels.en": 1}
+        )
+        return {result["entity"]: result["labels"].get("en") async for result in cursor}
+
+    async def close(self):
+        await self.elastic_retriever.close()
+        self.mongo.close()
@@ -1,13 +1,55 @@
+from model.cpu_executor import cpu_executor
 from model.literal_recognizer import LiteralRecognizer
-import spacy
+from model.nlp import extract_entities
+from itertools import islice
+from math import gcd, sqrt
+from statistics import NormalDist
+import csv
+import io
+import json
+import os
+import random
 import re
 
-nlp = spacy.load("en_core_web_sm")
+# Sampling mode: the columns longer than MIN_ROWS are classified on a stratified sample of rows,
+# starting from INITIAL rows and doubled until the decision is stable at CONFIDENCE
+COLUMN_SAMPLING_ENABLED = os.environ.get("COLUMN_SAMPLING_ENABLED", "true").lower() == "true"
+COLUMN_SAMPLING_MIN_ROWS = int(os.environ.get("COLUMN_SAMPLING_MIN_ROWS", 1000))
+COLUMN_SAMPLING_INITIAL = int(os.environ.get("COLUMN_SAMPLING_INITIAL", 200))
+COLUMN_SAMPLING_CONFIDENCE = float(os.environ.get("COLUMN_SAMPLING_CONFIDENCE", 0.95))
+COLUMN_SAMPLING_SEED = int(os.environ.get("COLUMN_SAMPLING_SEED", 42))
+# In sampling mode spaCy is skipped for the columns whose sampled cells are literals (numbers, dates,
+# urls, ...) for at least this share
+COLUMN_SKIP_NLP_RATIO = float(os.environ.get("COLUMN_SKIP_NLP_RATIO", 0.95))
+# Rows classified at once by the streaming column analysis
+COLUMN_STREAM_CHUNK_ROWS = int(os.environ.get("COLUMN_STREAM_CHUNK_ROWS", 1000))
+
+def read_table_rows(stream, table_format="csv"):
+    # rows (lists of cells) of a CSV or NDJSON (one JSON array of cells per line) binary stream, lazily
+    if not hasattr(stream, "read1"):
+        stream = io.BufferedReader(stream)
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if table_format == "csv":
+        for row in csv.reader(text):
+            if len(row) > 0:
+                yield row
+    else:
+        for line in text:
+            if line.strip() == "":
+                continue
+            row = json.loads(line)
+            if isinstance(row, dict):
+                row = list(row.values())
+            if not isinstance(row, list):
+                raise ValueError("Every NDJSON line must be an array of cells")
+            yield ["" if cell is None else str(cell) for cell in row]
+
 
 class ColumnAnalysis:
 
-    def __init__(self):
+    def __init__(self, column_cache=None):
         self.literal_recognizer = LiteralRecognizer()
+        self.column_cache = column_cache
        
         self.entity_type_dict = {
             "PERSON": "NE",
@@ -58,72 +100,241 @@ class ColumnAnalysis:
         self.NE_DATATYPE = ["PERSON", "NORP", "FAC", "ORG", "GPE", "LOC", "PRODUCT", "EVENT", "WORK_OF_ART", "LAW", "LANGUAGE"]
 
 
-    def classifiy_columns(self, columns = []):
-       
+    def classifiy_columns(self, columns = [], sample=COLUMN_SAMPLING_ENABLED):
+        rows = len(columns[0])
+        sampling = sample and rows > COLUMN_SAMPLING_MIN_ROWS
+        if sampling:
+            order = self._stratified_order(rows, COLUMN_SAMPLING_INITIAL)
+            sizes = []
+            size = COLUMN_SAMPLING_INITIAL
+            while size < rows:
+                sizes.append(size)
+                size *= 2
+            sizes.append(rows)
+            z = NormalDist().inv_cdf((1 + COLUMN_SAMPLING_CONFIDENCE) / 2)
+
+        states = [self._new_state() for _ in columns]
+        # the columns already classified (same cells, table size and mode) are not analyzed again
+        keys = []
+        if self.column_cache is not None:
+            keys = [self.column_cache.key(column, rows, sampling) for column in columns]
+            cached = self.column_cache.get_many(keys)
+            for state, key in zip(states, keys):
+                if key in cached:
+                    state["decision"] = tuple(cached[key]["decision"])
+                    state["sample_size"] = cached[key]["sample_size"]
+                    state["done"] = state["cached"] = True
+        previous_size = 0
+        for size in (sizes if sampling else [rows]):
+            active = [index for index, state in enumerate(states) if not state["done"]]
+            if len(active) == 0:
+                break
+            if sampling:
+                new_rows = list(islice(order, size - previous_size))
+                cells = {index: [columns[index][row] for row in new_rows if row < len(columns[index])] for index in active}
+            else:
+                cells = {index: columns[index] for index in active}
+            previous_size = size
+            self._count_cells(states, cells, skip_literal_columns=sampling)
+
+            for index in active:
+                state = states[index]
+                sample_size = state["sample_size"] if sampling else rows
+                decision = self._get_winning_data_and_datatype(dict(state["tags"]), dict(state["labels"]), sample_size)
+                # a sample is enough once two consecutive samples agree, far from the thresholds
+                state["done"] = not sampling or size >= rows or (
+                    decision == state["decision"]
+                    and self._is_stable(state["tags"], state["labels"], decision, sample_size, rows, z)
+                )
+                state["decision"] = decision
+
+        if len(keys) > 0:
+            self.column_cache.put_many({
+                key: {"decision": list(state["decision"]), "sample_size": state["sample_size"]}
+                for key, state in zip(keys, states)
+                if not state["cached"]
+            })
+
+        final_result = {}
+        for index, column in enumerate(columns):
+            winning_tag, winning_type, winning_datatype = states[index]["decision"]
+            final_result[index] = {
+                'index_column': index,
+                'tag': winning_tag,
+                'classification': winning_type,
+                'datatype': winning_datatype,
+                'column_rows': column,
+                'sample_size': states[index]["sample_size"]
+            }
+        return final_result
+    
+
+    def classify_stream(self, rows, chunk_size=COLUMN_STREAM_CHUNK_ROWS, keep_rows=False, header=None):
+        # Column analysis of a table read row by row (e.g. a CSV upload): the rows are classified in
+        # chunks and only the counters of every column are kept, unless keep_rows
+        states = []
+        columns = []
+        n_rows = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if len(chunk) == 0:
+                break
+            n_rows += len(chunk)
+            width = max(len(row) for row in chunk)
+            while len(states) < width:
+                states.append(self._new_state())
+                columns.append([])
+            # short rows have no cell in the last columns
+            cells = {index: [row[index] for row in chunk if index < len(row)] for index in range(width)}
+            self._count_cells(states, cells)
+            if keep_rows:
+                for index in range(width):
+                    columns[index].extend(cells[index])
+
+        final_result = {}
+        for index, state in enumerate(states):
+            winning_tag, winning_type, winning_datatype = self._get_winning_data_and_datatype(
+                state["tags"], state["labels"], n_rows
+            )
+            final_result[index] = {
+                'index_column': index,
+                'tag': winning_tag,
+                'classification': winning_type,
+                'datatype': winning_datatype,
+                'sample_size': state["sample_size"]
+            }
+            if header is not None:
+                final_result[index]['column_name'] = header[index] if index < len(header) else None
+            if keep_rows:
+                final_result[index]['column_rows'] = columns[index]
+        return final_result
+
+
+    def _new_state(self):
+        return {"labels": {}, "tags": {"NE": 0, "LIT": 0}, "sample_size": 0, "decision": None, "done": False, "cached": False}
+
+
+    def _count_cells(self, states, cells, skip_literal_columns=False):
+        # adds the labels and tags of the cells of every column ({index: cells}) to the column states
+
         def update_dict(dictionary, key, value=1):
             if key not in dictionary:
                 dictionary[key] = 0
             dictionary[key] += value    
 
-        final_result = {}
-        rows = len(columns[0])
-        for index, column in enumerate(columns):
-            final_result[index] = {} 
-            
-            # Analyze the concatenated text using Spacy
-            labels = {}
-            tags = {"NE": 0, "LIT": 0}
-
-            for cell in column:
-                is_number = False
-                label = None
-                try:
-                    float(cell)
-                    is_number = True
-                except:
-                    pass
-            
-                if is_number:
-                    label = "CARDINAL"
-                elif len(cell.split(" ")) >= 7:
-                    label = "DESC"
-                elif len(cell.split(" ")) == 1 and len(cell) <= 4:
-                    label = "TOKEN"
-                
+        # the cells not decided by the cheap checks go through the literal recognizer, in one batch
+        columns_labels = {index: [self._get_cheap_label(cell) for cell in column] for index, column in cells.items()}
+        pending = [
+            cell
+            for index, column in cells.items()
+            for cell, label in zip(column, columns_labels[index])
+            if label is None
+        ]
+        literal_labels = iter(cpu_executor.run(self.literal_recognizer.check_literals, pending, items=len(pending)))
+        for index, column_labels in columns_labels.items():
+            labels, tags = states[index]["labels"], states[index]["tags"]
+            for label in column_labels:
                 if label is not None:
                     update_dict(labels, label)
                     tag = self.entity_type_dict[label]
                     update_dict(tags, tag)
                 else:   
-                    label = self.literal_recognizer.check_literal(cell)  
+                    label = next(literal_labels)
                     if label != "STRING":
                         update_dict(labels, label)
                         tag = self.entity_type_dict[label]
                         update_dict(tags, tag)
-            
-  
-            text_to_analyze = " ; ".join(column)
-            doc = nlp(text_to_analyze)
-            for ent in doc.ents:
-                label = ent.label_
+            states[index]["sample_size"] += len(cells[index])
+
+        # Analyze the concatenated text of every column using Spacy, in one batch; with
+        # skip_literal_columns, only the columns not already decided by the checks above
+        nlp_columns = [
+            index for index in cells
+            if not skip_literal_columns
+            or not self._is_literal_column(states[index]["labels"], states[index]["sample_size"])
+        ]
+        columns_entities = extract_entities([" ; ".join(cells[index]) for index in nlp_columns])
+        for index, entities in zip(nlp_columns, columns_entities):
+            labels, tags = states[index]["labels"], states[index]["tags"]
+            for _, label, _, _ in entities:
                 if label in ["CARDINAL", "ORDINAL"]:
                     continue
                 update_dict(labels, label)
                 tag = self.entity_type_dict[label]
                 update_dict(tags, tag)
 
-            
-            winning_tag, winning_type, winning_datatype = self._get_winning_data_and_datatype(tags, labels, rows)
 
-            final_result[index] = {
-                'index_column': index,
-                'tag': winning_tag,
-                'classification': winning_type,
-                'datatype': winning_datatype,
-                'column_rows': column
-            }
-        return final_result
-    
+    def _stratified_order(self, rows, strata):
+        # Rows in sampling order: the table is split in contiguous blocks (strata), and every round
+        # takes one more row of each block, so every prefix of round size holds the same number of rows
+        # of every block. Rows are picked in a block by a seeded stride permutation, generated lazily.
+        rng = random.Random(COLUMN_SAMPLING_SEED)
+        strata = min(strata, rows)
+        blocks = []
+        for block in range(strata):
+            start, end = block * rows // strata, (block + 1) * rows // strata
+            length = end - start
+            stride = rng.randrange(1, length + 1)
+            while gcd(stride, length) != 1:
+                stride += 1
+            blocks.append((start, length, rng.randrange(length), stride))
+        for i in range(max(length for _, length, _, _ in blocks)):
+            for start, length, offset, stride in blocks:
+                if i < length:
+                    yield start + (offset + i * stride) % length
+
+
+    def _is_literal_column(self, labels, sample_size):
+        # literals found by the numeric/regex checks (DESC and TOKEN cells can hold entities)
+        literals = sum(count for label, count in labels.items() if label not in ("DESC", "TOKEN"))
+        return sample_size > 0 and literals >= sample_size * COLUMN_SKIP_NLP_RATIO
+
+
+    def _is_stable(self, tags, labels, decision, sample_size, rows, z):
+        # The per-row shares compared by _get_winning_data_and_datatype must be further than z standard
+        # errors from its thresholds, with the largest variance of a value in its range (so that a share
+        # of 0 or 1 on a small sample is not taken as certain) and the finite population correction
+        n = sample_size
+        if n == 0:
+            return False
+        fpc = sqrt((rows - n) / (rows - 1))
+
+        def away(count, threshold, value_range=1):
+            return abs(count / n - threshold) > z * value_range / 2 / sqrt(n) * fpc
+
+        winning_tag, _, _ = decision
+        if tags["LIT"] + tags["NE"] == 0:
+            return True
+        # NE <= 0.40 rows, NE > 2 rows and LIT >= NE (spaCy can find a few entities per cell)
+        if not (away(tags["NE"], 0.40, 3) and away(tags["NE"], 2, 3) and away(tags["NE"] - tags["LIT"], 0, 4)):
+            return False
+        if winning_tag == "LIT":
+            # the winning literal type holds at least 0.50 rows
+            best = max((labels.get(label, 0) for label in self.LIT_DATATYPE), default=0)
+            return away(best, 0.50)
+        # the winning entity type leads the second one
+        counts = sorted((labels.get(label, 0) for label in self.NE_DATATYPE), reverse=True)
+        return away(counts[0] - counts[1], 0, 2)
+
+
+    def _get_cheap_label(self, cell):
+        is_number = False
+        label = None
+        try:
+            float(cell)
+            is_number = True
+        except:
+            pass
+
+        if is_number:
+            label = "CARDINAL"
+        elif len(cell.split(" ")) >= 7:
+            label = "DESC"
+        elif len(cell.split(" ")) == 1 and len(cell) <= 4:
+            label = "TOKEN"
+        return label
+
 
     def _get_winning_data_and_datatype(self, tags, labels, rows):
         winning_tag = "NE"
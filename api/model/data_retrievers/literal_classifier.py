@@ -1,3 +1,4 @@
+from model.cpu_executor import cpu_executor
 from model.literal_recognizer import LiteralRecognizer
 
 class LiteralClassifier():
@@ -17,8 +18,10 @@ class LiteralClassifier():
 
     def classifiy_literal(self, literals_list):
         final_response = {}
-        for literal in literals_list:
-            classification = self.literal_recognizer.check_literal(literal)
+        classifications = cpu_executor.run(
+            self.literal_recognizer.check_literals, literals_list, items=len(literals_list)
+        )
+        for literal, classification in zip(literals_list, classifications):
             final_response[literal] = self.xml_datatypes[classification]
             
         return final_response
\ No newline at end of file
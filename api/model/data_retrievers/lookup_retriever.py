@@ -1,99 +1,432 @@
-import datetime
+import os
+import threading
+import time
 
-from model.elastic import Elastic
-from model.utils import clean_str, compute_similarity_between_string, editdistance
+from model.candidate_cache import CandidateCache
+from model.cpu_executor import cpu_executor
+from model.elastic import Elastic, type_qids
+from model.l1_cache import create_l1_cache, make_key
+from model.negative_cache import NEGATIVE_CACHE_ENABLED, NegativeCache
+from model.single_flight import SingleFlight
+from model.utils import clean_str, compute_ambiguity, score_mentions
+
+# Read ambiguity_mention/corrects_tokens from the table built by scripts/ambiguity_indexing.py. Off by
+# default: without the table every uncached lookup would pay a Mongo round trip before the token query
+AMBIGUITY_TABLE_ENABLED = os.environ.get("AMBIGUITY_TABLE_ENABLED", "false").lower() == "true"
+# Filter the hits of typed lookups on the types.ids field (indexes built with the current scripts/conf.py)
+LOOKUP_TYPES_FILTER = os.environ.get("LOOKUP_TYPES_FILTER", "false").lower() == "true"
+# Queries tried in order, as <prefix|fuzzy>:<size>, for the lookups without hits. A lookup leaves the
+# fallback once a tier gives it at least MIN_HITS hits, the tiers stop BUDGET_MS after the request start
+LOOKUP_FALLBACK_TIERS = os.environ.get("LOOKUP_FALLBACK_TIERS", "prefix:100,fuzzy:100,fuzzy:1000")
+LOOKUP_FALLBACK_MIN_HITS = int(os.environ.get("LOOKUP_FALLBACK_MIN_HITS", 1))
+LOOKUP_FALLBACK_BUDGET_MS = int(os.environ.get("LOOKUP_FALLBACK_BUDGET_MS", 2000))
+
+
+def parse_fallback_tiers(tiers):
+    parsed = []
+    for tier in tiers.split(","):
+        kind, size = tier.strip().split(":")
+        if kind not in ("prefix", "fuzzy"):
+            raise ValueError(f"Unknown fallback tier {kind}")
+        parsed.append((kind, int(size)))
+    return parsed
 
 
 class LookupRetriever:
 
-    def __init__(self, database, use_candidate_cache: bool = False):
+    def __init__(self, database, use_candidate_cache: bool = False, type_label_registry=None):
         self.database = database
+        self.type_label_registry = type_label_registry
         self.use_candidate_cache = use_candidate_cache
         if self.use_candidate_cache:
-            self.candidate_cache_collection.create_index(
-                [("cell", 1), ("type", 1), ("kg", 1), ("size", 1)], unique=True
-            )
+            self.candidate_cache = CandidateCache(database)
         else:
-            self.candidate_cache_collection = None
+            self.candidate_cache = None
+        self.l1_cache = create_l1_cache()
+        self.negative_cache = NegativeCache(database) if NEGATIVE_CACHE_ENABLED else None
         self.elastic_retriever = Elastic()
+        self.single_flight = SingleFlight()
+        self.use_ambiguity_table = AMBIGUITY_TABLE_ENABLED
+        self.fallback_tiers = parse_fallback_tiers(LOOKUP_FALLBACK_TIERS) if LOOKUP_FALLBACK_TIERS else []
+        self.fallback_min_hits = LOOKUP_FALLBACK_MIN_HITS
+        self.fallback_budget = LOOKUP_FALLBACK_BUDGET_MS / 1000
+        self.fallback_stats = {"budget_exceeded": 0}
+        self.stage_timings = {}
+        self.ambiguity_stats = {"hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
 
     def search(self, label, limit=100, kg="wikidata", fuzzy=False, types=None, ids=None):
-        if self.use_candidate_cache:
-            self.candidate_cache_collection = self.database.get_requested_collection("cache", kg=kg)
-        label_norm = label.strip().lower()
-        query_result = self._exec_query(label_norm, limit=limit, kg=kg, fuzzy=fuzzy, types=types, ids=ids)
+        lookup = self.prepare_lookup(label, limit=limit, kg=kg, fuzzy=fuzzy, types=types, ids=ids)
+
+        # identical lookups in flight at the same time are executed once
+        candidates = self.single_flight.do(self._l1_key(lookup), lambda: self._search_lookup(lookup))
+
+        return {lookup["cell"]: candidates}
+
+    def _search_lookup(self, lookup):
+        candidates = self.get_cached_candidates(lookup)
+        if candidates is None:
+            self._run_lookups([lookup], lookup["kg"])
+            self.cache_candidates(lookup)
+            candidates = lookup["candidates"]
+        return candidates
+
+    def search_batch(self, cells, kg="wikidata"):
+        # cells is a list of {"name", "limit", "fuzzy", "types", "ids"} dicts
+        lookups = self.prepare_lookups(cells, kg)
+
+        final_result = {}
+        pending = []
+        cached = self.get_cached_many(lookups, kg)
+        for i, lookup in enumerate(lookups):
+            if i in cached:
+                final_result[lookup["cell"]] = cached[i]
+            else:
+                pending.append(lookup)
+
+        # the lookups already in flight in other requests are awaited instead of executed again
+        leading, following = [], []
+        for lookup in pending:
+            key = self._l1_key(lookup)
+            call, leader = self.single_flight.begin(key)
+            (leading if leader else following).append((lookup, key, call))
+
+        try:
+            if len(leading) > 0:
+                self._run_lookups([lookup for lookup, _, _ in leading], kg)
+                self.cache_many([lookup for lookup, _, _ in leading], kg)
+        except Exception as e:
+            for lookup, key, call in leading:
+                self.single_flight.finish(key, call, error=e)
+            raise
+
+        for lookup, key, call in leading:
+            self.single_flight.finish(key, call, result=lookup["candidates"])
+            final_result[lookup["cell"]] = lookup["candidates"]
+
+        for lookup, key, call in following:
+            final_result[lookup["cell"]] = self.single_flight.wait(call)
+
+        return final_result
+
+    def prepare_lookup(self, label, limit=100, kg="wikidata", fuzzy=False, types=None, ids=None):
+        return {
+            "cell": label.strip().lower(),
+            "type": self._normalize_types(types),
+            "kg": kg,
+            "fuzzy": fuzzy,
+            "limit": limit,
+            "ids": ids,
+        }
+
+    def prepare_lookups(self, cells, kg="wikidata"):
+        # identical cells are looked up once
+        lookups = {}
+        for cell in cells:
+            lookup = self.prepare_lookup(
+                cell["name"],
+                limit=cell.get("limit", 100),
+                kg=kg,
+                fuzzy=cell.get("fuzzy", False),
+                types=cell.get("types"),
+                ids=cell.get("ids"),
+            )
+            key = (lookup["cell"], lookup["type"], lookup["fuzzy"], lookup["limit"], lookup["ids"])
+            lookups[key] = lookup
+        return list(lookups.values())
+
+    def plan_lookups(self, lookups, kg):
+        # Execution plan of a set of lookups, independent of how the I/O is performed: every step
+        # yields a request, ("msearch", [(body, limit, types), ...]), ("ambiguity", [(label, limit), ...])
+        # ("types", [type ids]) or ("scores", [(mention, labels), ...]), and receives its response. The fallback
+        # tiers yield ("msearch_budget", (searches, seconds)): an msearch cut at the remaining budget.
+        # _run_lookups drives it synchronously, AsyncLookupRetriever with asyncio.
+        # At the end every lookup holds its "candidates", the position in its hits of the hit each candidate
+        # was built from ("candidate_hits") and the "query", to be cached.
+        start = request_start = time.perf_counter()
+
+        # precomputed ambiguity statistics replace the token query of the labels already seen
+        ambiguity = {}
+        if self.use_ambiguity_table:
+            ambiguity = yield "ambiguity", list({(lookup["cell"], lookup["limit"]) for lookup in lookups})
+            found = sum(1 for lookup in lookups if (lookup["cell"], lookup["limit"]) in ambiguity)
+            self._count_ambiguity(found, len(lookups))
+            start = self._record_timing("ambiguity", start)
+
+        # main, ids and token queries do not depend on each other, so the
+        # queries of every lookup go out together in one msearch round
+        searches, targets = [], []
+        for lookup in lookups:
+            # the requested types route the candidate queries, ids and ambiguity are searched everywhere
+            lookup["query"] = self.create_query(name=lookup["cell"], fuzzy=lookup["fuzzy"], types=lookup["type"])
+            searches.append((lookup["query"], lookup["limit"], lookup["type"]))
+            targets.append((lookup, "hits"))
+            lookup["tier"] = "fuzzy" if lookup["fuzzy"] else "exact"
+            if lookup["ids"]:
+                searches.append((self.create_ids_query(name=lookup["cell"], ids=lookup["ids"]), 1000, None))
+                targets.append((lookup, "ids_hits"))
+            if (lookup["cell"], lookup["limit"]) in ambiguity:
+                lookup["ambiguity"] = ambiguity[(lookup["cell"], lookup["limit"])]
+            else:
+                searches.append((self.create_token_query(name=lookup["cell"]), lookup["limit"], None))
+                targets.append((lookup, "token_hits"))
+
+        results = yield "msearch", searches
+        for (lookup, target), (hits, _) in zip(targets, results):
+            lookup[target] = hits
+        start = self._record_timing("search", start)
+
+        # the fallback tiers only go out for the lookups without enough hits, cheapest first
+        fallback = [lookup for lookup in lookups if len(lookup["hits"]) < self.fallback_min_hits]
+        budget_exceeded = False
+        for kind, size in self.fallback_tiers:
+            if len(fallback) == 0:
+                break
+            remaining = self.fallback_budget - (time.perf_counter() - request_start)
+            if remaining <= 0:
+                budget_exceeded = True
+                break
+            tier = f"{kind}:{size}"
+            searches = []
+            for lookup in fallback:
+                if kind == "prefix":
+                    query = self.create_prefix_query(name=lookup["cell"], types=lookup["type"])
+                else:
+                    query = self.create_query(name=lookup["cell"], fuzzy=True, types=lookup["type"])
+                lookup["fallback_query"] = query
+                searches.append((query, size, lookup["type"]))
+            # the searches still running at the end of the budget return the hits found so far
+            results = yield "msearch_budget", (searches, remaining)
+            budget_exceeded = time.perf_counter() - request_start >= self.fallback_budget
+            for lookup, (hits, _) in zip(fallback, results):
+                # a wider tier only replaces the hits of a narrower one when it finds more
+                if len(hits) > len(lookup["hits"]):
+                    lookup["hits"] = hits
+                    lookup["query"] = lookup["fallback_query"]
+                    lookup["tier"] = tier
+                del lookup["fallback_query"]
+            fallback = [lookup for lookup in fallback if len(lookup["hits"]) < self.fallback_min_hits]
+            start = self._record_timing(f"fallback_{tier}", start)
+        if budget_exceeded and len(fallback) > 0:
+            # tiers skipped or cut by the budget: these lookups are not known to have no hits
+            for lookup in fallback:
+                lookup["budget_exceeded"] = True
+            with self._stats_lock:
+                self.fallback_stats["budget_exceeded"] += len(fallback)
+
+        # type labels of the whole batch are resolved at once
+        ids = set()
+        for lookup in lookups:
+            # every hit reports the query (tier) that produced it
+            for entity in lookup["hits"]:
+                entity["tier"] = lookup["tier"]
+            for entity in lookup.get("ids_hits", []):
+                entity["tier"] = "ids"
+            lookup["hits"] = lookup["hits"] + lookup.get("ids_hits", [])
+            ids.update(t for entity in lookup["hits"] for t in entity["types"].split(" "))
+        types_id_to_name = yield "types", list(ids)
+        start = self._record_timing("types", start)
+
+        # the string similarities of the whole batch are computed at once (see score_candidates)
+        scores = yield "scores", [
+            (clean_str(lookup["cell"]), [clean_str(entity["name"]) for entity in lookup["hits"]]) for lookup in lookups
+        ]
+        for lookup, lookup_scores in zip(lookups, scores):
+            if "ambiguity" in lookup:
+                ambiguity_mention, corrects_tokens = lookup["ambiguity"]
+            else:
+                ambiguity_mention, corrects_tokens = compute_ambiguity(lookup["cell"], lookup["token_hits"])
+            lookup["candidates"], lookup["candidate_hits"] = self._build_candidates(
+                lookup["cell"], lookup["hits"], ambiguity_mention, corrects_tokens, types_id_to_name, lookup_scores
+            )
+        self._record_timing("scoring", start)
+
+    def _run_lookups(self, lookups, kg):
+        plan = self.plan_lookups(lookups, kg)
+        request = next(plan)
+        while True:
+            kind, payload = request
+            if kind == "msearch":
+                response = self.elastic_retriever.msearch(payload, kg)
+            elif kind == "msearch_budget":
+                searches, timeout = payload
+                response = self.elastic_retriever.msearch(searches, kg, timeout=timeout)
+            elif kind == "ambiguity":
+                response = self._get_ambiguity(payload, kg)
+            elif kind == "scores":
+                response = self.score_candidates(payload)
+            else:
+                response = self._get_types_id_to_name(payload, kg)
+            try:
+                request = plan.send(response)
+            except StopIteration:
+                return
 
-        return query_result
+    def _record_timing(self, stage, start):
+        end = time.perf_counter()
+        elapsed_ms = (end - start) * 1000
+        with self._stats_lock:
+            stats = self.stage_timings.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["last_ms"] = elapsed_ms
+        return end
 
-    def _exec_query(self, label, limit=100, kg="wikidata", fuzzy=False, types=None, ids=None):
+    def get_stats(self):
+        with self._stats_lock:
+            timings = {
+                stage: {
+                    "count": stats["count"],
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                    "last_ms": round(stats["last_ms"], 3),
+                }
+                for stage, stats in self.stage_timings.items()
+            }
+        stats = {"stage_timings": timings, "coalescing": self.single_flight.get_stats()}
+        with self._stats_lock:
+            stats["fallback"] = dict(self.fallback_stats)
+        if self.use_ambiguity_table:
+            with self._stats_lock:
+                stats["ambiguity_table"] = dict(self.ambiguity_stats)
+        if self.type_label_registry is not None:
+            stats["type_labels"] = self.type_label_registry.get_stats()
+        if self.l1_cache is not None:
+            stats["l1_cache"] = self.l1_cache.get_stats()
+        if self.candidate_cache is not None:
+            stats["candidate_cache"] = self.candidate_cache.get_stats()
+        if self.negative_cache is not None:
+            stats["negative_cache"] = self.negative_cache.get_stats()
+        return stats
 
+    def _normalize_types(self, types):
         if types is not None:
             types = types.split(" ")
             types.sort()
             types = " ".join(types)
+        return types
 
-        body = {"cell": label, "type": types, "kg": kg, "fuzzy": fuzzy, "limit": limit}
+    def _l1_key(self, lookup):
+        # the active database of the KG is part of the key, so entries of an older dump are never served
+        return make_key(
+            self.database.mappings.get(lookup["kg"]),
+            lookup["cell"],
+            lookup["type"],
+            lookup["kg"],
+            lookup["fuzzy"],
+            lookup["limit"],
+            lookup["ids"],
+        )
 
-        if self.candidate_cache_collection is not None:
-            result = self.candidate_cache_collection.find_one_and_update(
-                body, {"$set": {"lastAccessed": datetime.datetime.utcnow()}}
-            )
-        else:
-            result = None
+    def get_cached_candidates(self, lookup):
+        if self.l1_cache is not None:
+            candidates = self.l1_cache.get(self._l1_key(lookup))
+            if candidates is not None:
+                return candidates
+        if self.candidate_cache is not None:
+            candidates = self.candidate_cache.get(lookup)
+            if candidates is not None:
+                if self.l1_cache is not None:
+                    self.l1_cache.put(self._l1_key(lookup), candidates)
+                return candidates
+        # the negative key has no ids: the lookups with ids are never stored there, nor read
+        if self.negative_cache is not None and not lookup["ids"] and self.negative_cache.contains(lookup):
+            return []
+        return None
 
-        if result is not None:
-            final_result = result["candidates"]
-            final_result = {label: final_result}
-            return final_result
+    def get_cached_many(self, lookups, kg):
+        # cached candidates of a batch, keyed by position in lookups
+        cached = {}
+        missing = []
+        for i, lookup in enumerate(lookups):
+            candidates = self.l1_cache.get(self._l1_key(lookup)) if self.l1_cache is not None else None
+            if candidates is not None:
+                cached[i] = candidates
+            else:
+                missing.append(i)
 
-        query = self.create_query(name=label, fuzzy=fuzzy)
-        final_result = {label: []}
-        result = []
+        if self.candidate_cache is not None and len(missing) > 0:
+            found = self.candidate_cache.get_many([lookups[i] for i in missing], kg)
+            for j, candidates in found.items():
+                cached[missing[j]] = candidates
+                if self.l1_cache is not None:
+                    self.l1_cache.put(self._l1_key(lookups[missing[j]]), candidates)
 
-        result, _ = self.elastic_retriever.search(query, kg, limit)
+        missing = [i for i in missing if i not in cached and not lookups[i]["ids"]]
+        if self.negative_cache is not None and len(missing) > 0:
+            for j in self.negative_cache.contains_many([lookups[i] for i in missing], kg):
+                cached[missing[j]] = []
+        return cached
 
-        if len(result) == 0:
-            query = self.create_query(name=label, fuzzy=True)
-            result, _ = self.elastic_retriever.search(query, kg, limit=1000)
+    def cache_many(self, lookups, kg):
+        negative = [lookup for lookup in lookups if self._is_negative(lookup)]
+        if len(negative) > 0:
+            self.negative_cache.add_many(negative, kg)
+        for lookup in lookups:
+            if not self._is_negative(lookup):
+                self.cache_candidates(lookup)
 
-        if ids:
-            query = self.create_ids_query(name=label, ids=ids)
-            result2, _ = self.elastic_retriever.search(query, kg, limit=1000)
-            result = result + result2
+    def _is_negative(self, lookup):
+        # empty results are only trusted when every query ran: no ids query, no tier skipped by the budget
+        return (
+            self.negative_cache is not None
+            and len(lookup["candidates"]) == 0
+            and not lookup["ids"]
+            and not lookup.get("budget_exceeded", False)
+        )
 
-        mention_clean = clean_str(label)
-        ntoken_mention = len(label.split(" "))
-        length_mention = len(label)
+    def cache_candidates(self, lookup):
+        if lookup.get("budget_exceeded", False):
+            # the tiers skipped or cut by the budget may have missed hits: the result is not final
+            return
+        if self._is_negative(lookup):
+            self.negative_cache.add(lookup)
+            return
+        if self.l1_cache is not None:
+            self.l1_cache.put(self._l1_key(lookup), lookup["candidates"])
+        if self.candidate_cache is not None:
+            self.candidate_cache.put(lookup, lookup["candidates"], lookup["query"])
+
+    def _get_ambiguity(self, labels, kg):
+        collection = self.database.get_requested_collection("ambiguity", kg=kg)
+        return self.parse_ambiguity(collection.find(self.create_ambiguity_query(labels), {"_id": 0}))
+
+    def create_ambiguity_query(self, labels):
+        return {"label": {"$in": list({label for label, _ in labels})}, "limit": {"$in": list({limit for _, limit in labels})}}
+
+    def parse_ambiguity(self, documents):
+        return {
+            (document["label"], document["limit"]): (document["ambiguity_mention"], document["corrects_tokens"])
+            for document in documents
+        }
 
-        query_token = self.create_token_query(name=label)
-        result_to_discard, _ = self.elastic_retriever.search(query_token, kg, limit)
-        ambiguity_mention, corrects_tokens = (0, 0)
-        history_labels, tokens_set = (set(), set())
-        for entity in result_to_discard:
-            label_clean = clean_str(entity["name"])
-            tokens = label_clean.split(" ")
-            for token in tokens:
-                tokens_set.add(token)
-            if mention_clean == label_clean and entity["id"] not in history_labels:
-                ambiguity_mention += 1
-            history_labels.add(entity["id"])
-        tokens_mention = set(mention_clean.split(" "))
-        ambiguity_mention = ambiguity_mention / len(history_labels) if len(history_labels) > 0 else 0
-        ambiguity_mention = round(ambiguity_mention, 3)
-        corrects_tokens = round(len(tokens_mention.intersection(tokens_set)) / len(tokens_mention), 3)
-
-        ids = list(set([t for entity in result for t in entity["types"].split(" ")]))
+    def _count_ambiguity(self, hits, lookups):
+        with self._stats_lock:
+            self.ambiguity_stats["hits"] += hits
+            self.ambiguity_stats["misses"] += lookups - hits
+
+    def _get_types_id_to_name(self, ids, kg):
+        if self.type_label_registry is not None:
+            types_id_to_name = self.type_label_registry.get_labels(ids, kg)
+            if types_id_to_name is not None:
+                return types_id_to_name
         items_collection = self.database.get_requested_collection("items", kg=kg)
         results = items_collection.find({"category": "type", "entity": {"$in": ids}})
-        types_id_to_name = {result["entity"]: result["labels"].get("en") for result in results}
+        return {result["entity"]: result["labels"].get("en") for result in results}
+
+    def score_candidates(self, mentions):
+        # CPU-bound: large batches run on the CPU pool
+        return cpu_executor.run(score_mentions, mentions, items=sum(len(labels) for _, labels in mentions))
+
+    def _build_candidates(self, label, result, ambiguity_mention, corrects_tokens, types_id_to_name, scores):
+        ntoken_mention = len(label.split(" "))
+        length_mention = len(label)
 
         history = {}
-        for entity in result:
+        hit_indexes = {}
+        for i, (entity, (ed_score, jaccard_score, jaccard_ngram_score)) in enumerate(zip(result, scores)):
             id_entity = entity["id"]
-            label_clean = clean_str(entity["name"])
-            ed_score = round(editdistance(label_clean, mention_clean), 2)
-            jaccard_score = round(compute_similarity_between_string(label_clean, mention_clean), 2)
-            jaccard_ngram_score = round(compute_similarity_between_string(label_clean, mention_clean, 3), 2)
             obj = {
                 "id": entity["id"],
                 "name": entity["name"],
@@ -113,32 +446,34 @@ class LookupRetriever:
                 "ed_score": ed_score,
                 "jaccard_score": jaccard_score,
                 "jaccardNgram_score": jaccard_ngram_score,
+                "tier": entity["tier"],
             }
             if id_entity not in history:
                 history[id_entity] = obj
+                hit_indexes[id_entity] = i
             elif (ed_score + jaccard_score) > (history[id_entity]["ed_score"] + history[id_entity]["jaccard_score"]):
                 history[id_entity] = obj
+                hit_indexes[id_entity] = i
 
-        final_result[label] = list(history.values())
+        return list(history.values()), list(hit_indexes.values())
 
-        try:
-            if self.candidate_cache_collection is not None:
-                self.candidate_cache_collection.insert_one(
-                    {
-                        "cell": label,
-                        "type": types,
-                        "kg": kg,
-                        "candidates": final_result[label],
-                        "lastAccessed": datetime.datetime.utcnow(),
-                        "fuzzy": fuzzy,
-                        "limit": limit,
-                        "query": query,
-                    }
-                )
-        except:
-            pass
+    def create_prefix_query(self, name, types=None):
+        # the last token of the mention can be incomplete (e.g. truncated cells)
+        query_base = {
+            "query": {"bool": {"must": [{"match_phrase_prefix": {"name": {"query": name}}}]}},
+            "sort": [{"popularity": {"order": "desc"}}],
+        }
 
-        return final_result
+        # add types
+        self.add_types_filter(query_base, types)
+
+        return query_base
+
+    def add_types_filter(self, query_base, types):
+        # only the QIDs can match types.ids, a filter without any would drop every hit
+        type_ids = type_qids(types) if LOOKUP_TYPES_FILTER else []
+        if len(type_ids) > 0:
+            query_base["query"]["bool"]["filter"] = [{"terms": {"types.ids": type_ids}}]
 
     def create_token_query(self, name):
         query = {"query": {"match": {"name": name}}}
@@ -153,7 +488,7 @@ class LookupRetriever:
         query_base["query"]["bool"]["must"].append({"match": {"id": {"query": ids, "boost": 2.0}}})
         return query_base
 
-    def create_query(self, name, fuzzy=False):
+    def create_query(self, name, fuzzy=False, types=None):
         splitted_name = name.split(" ")
 
         # base query
@@ -179,4 +514,7 @@ class LookupRetriever:
                 {"match": {"name": {"query": name, "boost": 2}}}
             )  # add token (normal query)
 
+        # add types
+        self.add_types_filter(query_base, types)
+
         return query_base
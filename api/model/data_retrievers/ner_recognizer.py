@@ -1,21 +1,16 @@
-import spacy
+from model.nlp import extract_entities
 
 class NERRecognizer:
 
-    def __init__(self):
-        self.nlp = spacy.load("en_core_web_sm")
-
     def recognize_entities(self, text_list):
         final_response = {}
 
-        for index, text in enumerate(text_list):
-            doc = self.nlp(text)
-
-            ner = []
-            for ent in doc.ents:
-                print(ent.text, ent.start_char, ent.end_char, ent.label_)
-                ner.append({'mention': ent.text, 'classification': ent.label_, 'start_index': ent.start_char, 'end_index': ent.end_char})
-            
+        # one batched inference for all the texts
+        for index, (text, entities) in enumerate(zip(text_list, extract_entities(text_list))):
+            ner = [
+                {'mention': mention, 'classification': label, 'start_index': start, 'end_index': end}
+                for mention, label, start, end in entities
+            ]
             final_response[f"{index}"] = {"text": text, "ner": ner}
 
         return final_response
\ No newline at end of file
@@ -0,0 +1,112 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Concurrent stages (lookup chunks, types and objects fetches) of the table interpretations of a worker
+TABLE_INTERPRETATION_WORKERS = int(os.environ.get("TABLE_INTERPRETATION_WORKERS", 8))
+# Distinct cells per lookup batch
+TABLE_LOOKUP_CHUNK = int(os.environ.get("TABLE_LOOKUP_CHUNK", 200))
+
+
+class TableInterpreter:
+    # Semantic table interpretation in one request: column analysis, lookups of the distinct cells of
+    # the NE columns, then types and objects of the top candidates of every cell, and the predicates
+    # linking the candidates of the same row in every pair of NE columns.
+    # The lookup batches run concurrently, and the types and objects of a batch are fetched as soon as
+    # its lookups are done, while the other batches are still running. Under gevent the stages are
+    # greenlets, so the pool only bounds how many of them run at the same time.
+
+    def __init__(self, column_analysis, lookup_retriever, type_retriever, objects_retriever,
+                 workers=TABLE_INTERPRETATION_WORKERS, chunk_size=TABLE_LOOKUP_CHUNK):
+        self.column_analysis = column_analysis
+        self.lookup_retriever = lookup_retriever
+        self.type_retriever = type_retriever
+        self.objects_retriever = objects_retriever
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # created on first use, in the worker: a pool created at import (in the gunicorn master when the
+        # app is preloaded) would run on real threads and block the gevent hub
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sti")
+        return self._executor
+
+    def interpret(self, columns, kg="wikidata", limit=10, top_k=3, fuzzy=False, sample=True, return_objects=False):
+        analysis = self.column_analysis.classifiy_columns(columns=columns, sample=sample)
+        ne_columns = [index for index, result in analysis.items() if result["tag"] == "NE"]
+
+        # distinct cells of the NE columns, normalized like the lookups
+        cells = list(dict.fromkeys(
+            cell.strip().lower() for index in ne_columns for cell in columns[index] if cell.strip() != ""
+        ))
+
+        entities = {}
+        types = {}
+        objects = {}
+        futures = {}
+        for start in range(0, len(cells), self.chunk_size):
+            chunk = [{"name": cell, "limit": limit, "fuzzy": fuzzy} for cell in cells[start:start + self.chunk_size]]
+            futures[self.executor.submit(self.lookup_retriever.search_batch, chunk, kg)] = "lookup"
+        pending = set(futures)
+        while len(pending) > 0:
+            future = next(as_completed(pending))
+            pending.remove(future)
+            stage = futures[future]
+            result = future.result()
+            if stage == "lookup":
+                entities.update(result)
+                ids = list({candidate["id"] for candidates in result.values() for candidate in candidates[:top_k]})
+                if len(ids) > 0:
+                    for stage, function in (("types", self.type_retriever.get_types_output),
+                                            ("objects", self.objects_retriever.get_objects)):
+                        future = self.executor.submit(function, ids, kg)
+                        futures[future] = stage
+                        pending.add(future)
+            elif stage == "types":
+                for entity_types in result.values():
+                    types.update(entity_types)
+            else:
+                objects.update(result)
+
+        for index in analysis:
+            analysis[index].pop("column_rows", None)
+        response = {
+            "columns": analysis,
+            "entities": entities,
+            "types": types,
+            "predicates": self._column_predicates(columns, ne_columns, entities, objects, top_k),
+        }
+        if return_objects:
+            response["objects"] = objects
+        return response
+
+    def _column_predicates(self, columns, ne_columns, entities, objects, top_k):
+        # for every pair of NE columns, how many rows link a top candidate of the first to one of the
+        # second through each predicate
+        predicates = {}
+        for subject_column in ne_columns:
+            for object_column in ne_columns:
+                if subject_column == object_column:
+                    continue
+                counts = {}
+                for subject_cell, object_cell in zip(columns[subject_column], columns[object_column]):
+                    subject_candidates = entities.get(subject_cell.strip().lower(), [])[:top_k]
+                    object_ids = {candidate["id"] for candidate in entities.get(object_cell.strip().lower(), [])[:top_k]}
+                    row_predicates = set()
+                    for candidate in subject_candidates:
+                        subject_objects = objects.get(candidate["id"], {}).get("objects", {})
+                        for object_id in object_ids.intersection(subject_objects):
+                            row_predicates.update(subject_objects[object_id])
+                    for predicate in row_predicates:
+                        counts[predicate] = counts.get(predicate, 0) + 1
+                if len(counts) > 0:
+                    predicates[f"{subject_column} {object_column}"] = dict(
+                        sorted(counts.items(), key=lambda item: item[1], reverse=True)
+                    )
+        return predicates
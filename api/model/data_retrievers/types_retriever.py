@@ -1,15 +1,23 @@
 
 class TypesRetriever:
 
-    def __init__(self, database):
+    def __init__(self, database, type_label_registry=None):
         self.database = database
-        
+        self.type_label_registry = type_label_registry
+
 
     def get_types(self, entities = [], kg = "wikidata"):
         if kg in self.database.get_supported_kgs():
             return self.database.get_requested_collection("types", kg).find({'entity': {'$in': list(entities)}})
     
 
+    def get_type_labels(self, ids = [], kg = "wikidata"):
+        # labels come only from a loaded registry, without querying the items
+        if self.type_label_registry is not None:
+            return self.type_label_registry.get_labels(ids, kg)
+        return None
+
+
     def get_types_output(self, entities = [], kg = []):
 
         final_response = {}
@@ -24,6 +32,12 @@ class TypesRetriever:
                 wiki_entity_types[entity_id] = {}
                 wiki_entity_types[entity_id]['types'] = entity_types
 
+            type_ids = {id_type for entity in wiki_entity_types.values() for ids in entity['types'].values() for id_type in ids}
+            type_labels = self.get_type_labels(list(type_ids), kg)
+            if type_labels is not None:
+                for entity in wiki_entity_types.values():
+                    entity['labels'] = {id_type: type_labels.get(id_type) for ids in entity['types'].values() for id_type in ids}
+
             final_response['wikidata'] = wiki_entity_types
         
         return final_response
\ No newline at end of file
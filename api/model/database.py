@@ -1,8 +1,11 @@
 import os
-import random
-from faker import Faker
-from pymongo import MongoClient
+import threading
+import time
+import traceback
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import PyMongoError
 from datetime import datetime
+from model.fake_kg import FAKE_DB_NAME, bootstrap_fake_db
 
 # Constants
 MONGO_ENDPOINT, MONGO_PORT = os.environ["MONGO_ENDPOINT"].split(":")
@@ -10,7 +13,16 @@ MONGO_USERNAME = os.environ["MONGO_INITDB_ROOT_USERNAME"]
 MONGO_PASSWORD = os.environ["MONGO_INITDB_ROOT_PASSWORD"]
 SUPPORTED_KGS  = os.environ["SUPPORTED_KGS"]
 SUPPORTED_KGS = SUPPORTED_KGS.split(",")
-FAKE_DB_NAME = "fake"  # Name of the fake database
+# How the fake KG is created when missing: background, startup or off
+FAKE_DB_BOOTSTRAP = os.environ.get("FAKE_DB_BOOTSTRAP", "background").lower()
+# Seconds between two refreshes of the KG -> database mappings (0 disables the background refresher)
+MAPPINGS_REFRESH_INTERVAL = int(os.environ.get("MAPPINGS_REFRESH_INTERVAL", 60))
+# Also refresh as soon as a metadata collection changes (needs a replica set)
+MAPPINGS_CHANGE_STREAM = os.environ.get("MAPPINGS_CHANGE_STREAM", "false").lower() == "true"
+# Seconds between two checks of the refresh requests (POST /info/mappings/refresh bumps a version document
+# in MAPPINGS_SIGNAL_DB, followed by every worker); 0 makes the endpoint refresh only the worker serving it
+MAPPINGS_SIGNAL_INTERVAL = float(os.environ.get("MAPPINGS_SIGNAL_INTERVAL", 2))
+MAPPINGS_SIGNAL_DB = os.environ.get("MAPPINGS_SIGNAL_DB", "lamapi")
 
 class Database():
 
@@ -21,12 +33,125 @@ class Database():
             username = MONGO_USERNAME, 
             password = MONGO_PASSWORD
         )
-        self.mappings = {kg.lower():None for kg in SUPPORTED_KGS}
-        self.mappings["fake"] = FAKE_DB_NAME  # Add the fake database to mappings
-        self.initialize_and_populate_fake_db()
-        self.update_mappings()
+        self._mappings = {kg.lower():None for kg in SUPPORTED_KGS}
+        self._mappings["fake"] = FAKE_DB_NAME  # Add the fake database to mappings
+        self._mappings_listeners = []
+        self._mappings_lock = threading.Lock()
+        self._mappings_refreshed_at = 0
+        self._mappings_version = None
+        self.refresh_interval = MAPPINGS_REFRESH_INTERVAL
+        # MongoClient connects lazily, the rest of the setup runs on the first use of the mappings
+        self._init_lock = threading.RLock()
+        self._initializing = False
+        self._ready = threading.Event()
+
+    @property
+    def mappings(self):
+        self.ensure_initialized()
+        return self._mappings
+
+    def ensure_initialized(self):
+        if self._ready.is_set():
+            return
+        with self._init_lock:
+            # the mappings listeners can read the mappings while they are being loaded
+            if self._ready.is_set() or self._initializing:
+                return
+            self._initializing = True
+            try:
+                self.initialize_and_populate_fake_db()
+                if MAPPINGS_SIGNAL_INTERVAL > 0:
+                    # read before the refresh, so that a request made in the meantime is not missed
+                    self._mappings_version = self._read_mappings_version()
+                self._refresh_mappings()
+                self.start_mappings_refresher()
+                self._ready.set()
+            finally:
+                self._initializing = False
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def start_mappings_refresher(self):
+        if self.refresh_interval > 0 or MAPPINGS_SIGNAL_INTERVAL > 0:
+            threading.Thread(target=self._refresh_periodically, daemon=True).start()
+        if MAPPINGS_CHANGE_STREAM:
+            threading.Thread(target=self._refresh_on_change, daemon=True).start()
+
+    def _refresh_periodically(self):
+        # every refresh_interval, and as soon as a refresh is requested to any worker
+        period = min(interval for interval in (self.refresh_interval, MAPPINGS_SIGNAL_INTERVAL) if interval > 0)
+        while True:
+            time.sleep(period)
+            try:
+                due = self.refresh_interval > 0 and time.monotonic() - self._mappings_refreshed_at >= self.refresh_interval
+                if self._refresh_requested() or due:
+                    self._refresh_mappings()
+            except PyMongoError as e:
+                print(f"Mappings refresh failed: {e}", flush=True)
+
+    def _signal_collection(self):
+        return self.mongo[MAPPINGS_SIGNAL_DB]["mappings_signal"]
+
+    def _read_mappings_version(self):
+        document = self._signal_collection().find_one({"_id": "mappings"})
+        return document["version"] if document is not None else 0
+
+    def _refresh_requested(self):
+        if MAPPINGS_SIGNAL_INTERVAL <= 0:
+            return False
+        version = self._read_mappings_version()
+        requested = version != self._mappings_version
+        self._mappings_version = version
+        return requested
+
+    def _refresh_on_change(self):
+        # a dump is activated when its metadata document leaves the DOING status
+        pipeline = [{"$match": {"ns.coll": "metadata"}}]
+        try:
+            with self.mongo.watch(pipeline) as stream:
+                for _ in stream:
+                    self._refresh_mappings()
+        except PyMongoError as e:
+            print(f"Mappings change stream stopped, falling back to the periodic refresh: {e}", flush=True)
+
+    def refresh_mappings_if_stale(self):
+        # the background refresher keeps the mappings fresh, this only runs when it is late
+        # (e.g. its thread did not survive a fork of the worker)
+        self.ensure_initialized()
+        if self.refresh_interval > 0 and self._mappings_are_stale():
+            with self._mappings_lock:
+                if self._mappings_are_stale():
+                    self._update_mappings()
+                    self._mappings_refreshed_at = time.monotonic()
+
+    def _mappings_are_stale(self):
+        return time.monotonic() - self._mappings_refreshed_at > 2 * self.refresh_interval
+
+    def add_mappings_listener(self, listener):
+        # listener(kg, old_db_name, new_db_name) is called when a KG switches to another database
+        self._mappings_listeners.append(listener)
 
     def update_mappings(self):
+        # the other workers refresh when they see the new version
+        self.ensure_initialized()
+        if MAPPINGS_SIGNAL_INTERVAL > 0:
+            document = self._signal_collection().find_one_and_update(
+                {"_id": "mappings"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            self._mappings_version = document["version"]
+        return self._refresh_mappings()
+
+    def _refresh_mappings(self):
+        with self._mappings_lock:
+            self._update_mappings()
+            self._mappings_refreshed_at = time.monotonic()
+        return self._mappings
+
+    def _update_mappings(self):
+        # the new mappings are swapped in at once, requests never see a half updated dict
+        previous_mappings = self._mappings
+        mappings = dict(previous_mappings)
         history = {}
         for db in self.mongo.list_database_names():
             # Handle real databases
@@ -35,136 +160,44 @@ class Database():
                 continue
             kg_name = ''.join(filter(str.isalpha, db))
             date = ''.join(filter(str.isdigit, db))
-            if kg_name in self.mappings and kg_name != "fake":  # Exclude the fake database
+            if kg_name in mappings and kg_name != "fake":  # Exclude the fake database
                 parsed_date = datetime.strptime(date, "%d%m%Y")
                 if kg_name not in history:
                     history[kg_name] = parsed_date
-                    self.mappings[kg_name] = db
+                    mappings[kg_name] = db
                 elif parsed_date > history[kg_name]:
                     history[kg_name] = parsed_date
-                    self.mappings[kg_name] = db
+                    mappings[kg_name] = db
             # Initialize the fake database
             elif kg_name == "fake":
-                self.mappings["fake"] = FAKE_DB_NAME
+                mappings["fake"] = FAKE_DB_NAME
+
+        self._mappings = mappings
+        for kg, db_name in mappings.items():
+            if previous_mappings.get(kg) != db_name:
+                for listener in self._mappings_listeners:
+                    listener(kg, previous_mappings.get(kg), db_name)
 
     def initialize_and_populate_fake_db(self):
-        if FAKE_DB_NAME not in self.mongo.list_database_names():
-            self.populate_fake_db()
-
-            print("Fake database initialized and populated.")
-
-    def populate_fake_db(self):
-        fake_db = self.mongo[FAKE_DB_NAME]
-        fake = Faker()
-        nrandom_exmple = 10000
-        # Populating the 'cache' collection
-        cache_collection = fake_db["cache"]
-        for _ in range(nrandom_exmple):  # Adjust the number for your needs
-            word = fake.word()
-            cache_data = {
-                "cell": word,
-                "type": None,
-                "kg": "fake",
-                "candidates": [{
-                    "id": fake.random_number(digits=5),
-                    "name": fake.name(),
-                    "description": fake.sentence(),
-                    "types": [{"id": fake.random_number(digits=5), "name": fake.word()}],
-                    "ambiguity_mention": random.uniform(0, 1),
-                    "corrects_tokens": random.uniform(0, 1),
-                    "ntoken_mention": random.randint(1, 5),
-                    "ntoken_entity": random.randint(1, 5),
-                    "length_mention": random.randint(1, 10),
-                    "length_entity": random.randint(1, 10),
-                    "popularity": random.uniform(0, 1),
-                    "pos_score": random.uniform(0, 1),
-                    "es_score": random.uniform(0, 1),
-                    "ed_score": random.uniform(0, 1),
-                    "jaccard_score": random.uniform(0, 1),
-                    "jaccardNgram_score": random.uniform(0, 1),
-                    "cosine_similarity": random.uniform(0, 1)
-                } for _ in range(random.randint(1, 100))],  # Random number of candidates
-                "lastAccessed": datetime.now(),
-                "fuzzy": False,
-                "limit": 100,
-                "query": {"query": {"match": {"name": word}}}
-            }
-            cache_collection.insert_one(cache_data)
-
-        # Populating the 'items' collection
-        items_collection = fake_db["items"]
-        for _ in range(nrandom_exmple):
-            items_data = {
-                "id_entity": fake.random_number(digits=5),
-                "entity": fake.word(),
-                "description": {"language": "en", "value": fake.sentence()},
-                "labels": {fake.language_code(): fake.word() for _ in range(random.randint(1, 5))},
-                "aliases": {fake.language_code(): [fake.word() for _ in range(random.randint(1, 3))] for _ in range(random.randint(1, 5))},
-                "types": {"P31": [f'Q{fake.random_number(digits=5)}' for _ in range(random.randint(1, 3))] for _ in range(random.randint(1, 5))},
-                "popularity": random.randint(1, 1000),
-                "category": "entity"
-            }
-            items_collection.insert_one(items_data)
-
-        # Populating the 'literals' collection
-        literals_collection = fake_db["literals"]
-        for _ in range(nrandom_exmple):
-            literals_data = {
-                "id_entity": fake.random_number(digits=5),
-                "entity": fake.word(),
-                "literals": {
-                    "GEOSHAPE": {"P" + str(fake.random_number(digits=5)): [fake.word()]},
-                    "DATETIME": {"P" + str(fake.random_number(digits=5)): [fake.iso8601()]},
-                    "MUSICAL_NOTATION": {},
-                    "TABULAR_DATA": {},
-                    "MATH": {},
-                    "NUMBER": {"P" + str(fake.random_number(digits=5)): [str(fake.random_number(digits=8))]},
-                    "STRING": {"P" + str(fake.random_number(digits=5)): [fake.word()]}
-                }
-            }
-            literals_collection.insert_one(literals_data)
-
-        # Populating the 'mappings' collection
-        mappings_collection = fake_db["mappings"]
-        for _ in range(nrandom_exmple):
-            mappings_data = {
-                "curid": str(fake.random_number(digits=5)),
-                "wikipedia_id": fake.word(),
-                "wikidata_id": "Q" + str(fake.random_number(digits=5)),
-                "dbpedia_id": fake.word()
-            }
-            mappings_collection.insert_one(mappings_data)
-
-        # Populating the 'objects' collection
-        objects_collection = fake_db["objects"]
-        for _ in range(nrandom_exmple):
-            objects_data = {
-                "id_entity": fake.random_number(digits=5),
-                "entity": "Q" + str(fake.random_number(digits=5)),
-                "objects": {
-                    "Q" + str(fake.random_number(digits=5)): ["P" + str(fake.random_number(digits=5))]
-                }
-            }
-            objects_collection.insert_one(objects_data)
-
-        # Populating the 'types' collection
-        types_collection = fake_db["types"]
-        for _ in range(nrandom_exmple):
-            types_data = {
-                "id_entity": fake.random_number(digits=5),
-                "entity": "Q" + str(fake.random_number(digits=5)),
-                "types": {
-                    "P" + str(fake.random_number(digits=5)): ["Q" + str(fake.random_number(digits=5))]
-                }
-            }
-            types_collection.insert_one(types_data)
-
-        print("Fake database collections populated.")
+        # the fake KG is created off the request path: in a background thread (default), before the
+        # workers start with scripts/fake_db_bootstrap.py, or at startup as before
+        if FAKE_DB_BOOTSTRAP == "background":
+            threading.Thread(target=self._bootstrap_fake_db, daemon=True).start()
+        elif FAKE_DB_BOOTSTRAP == "startup":
+            self._bootstrap_fake_db()
+
+    def _bootstrap_fake_db(self):
+        # any failure is reported: in the background thread it would otherwise go unnoticed
+        try:
+            bootstrap_fake_db(self.mongo)
+        except Exception as e:
+            print(f"Fake database bootstrap failed: {e}", flush=True)
+            traceback.print_exc()
 
     def create_indexes(self):
         # Specify the collections and their respective fields to be indexed
         index_specs = {
-            'cache': ['cell', 'lastAccessed'],  # Example: Indexing 'cell' and 'type' fields in 'cache' collection
+            'cache': ['cell'],  # the TTL index on 'lastAccessed' is created by CandidateCache
             'items': ['id_entity', 'entity', 'category', 'popularity'],
             'literals': ['id_entity', 'entity'],
             'mappings': ['curid', 'wikipedia_id', 'wikidata_id', 'dbpedia_id'],
@@ -176,7 +209,7 @@ class Database():
             db = self.mongo[db_name]
             for collection, fields in index_specs.items():
                 if collection == "cache":
-                    db[collection].create_index([('cell', 1), ('fuzzy', 1), ('type', 1), ('kg', 1), ('limit', 1)], unique=True)
+                    db[collection].create_index([('cell', 1), ('fuzzy', 1), ('type', 1), ('kg', 1), ('ids', 1)], unique=True)
                 elif collection == "items":
                     db[collection].create_index([('entity', 1), ('category', 1)], unique=True)    
                 for field in fields:
@@ -193,7 +226,7 @@ class Database():
         }
 
     def get_requested_collection(self, collection, kg = "wikidata"):
-        self.update_mappings()
+        self.refresh_mappings_if_stale()
         if kg in self.mappings and self.mappings[kg] is not None: 
             return self.mongo[self.mappings[kg]][collection]
         else:
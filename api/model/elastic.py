@@ -1,10 +1,13 @@
+import asyncio
 import json
 import os
+import re
 import subprocess
+import time
 import warnings
 from time import sleep
 
-from elasticsearch import ConnectionError, Elasticsearch
+from elasticsearch import AsyncElasticsearch, ConnectionError, ConnectionTimeout, Elasticsearch
 
 # Extract environment variables
 ELASTIC_USER = os.environ["ELASTICSEARCH_USERNAME"]
@@ -13,12 +16,30 @@ if ELASTIC_PW != "":
     warnings.warn("Using password for Elasticsearch is not recommended. Setting to empty string.")
     ELASTIC_PW = ""
 ELASTIC_ENDPOINT, ELASTIC_PORT = os.environ["ELASTIC_ENDPOINT"].split(":")
+# Max number of searches sent in a single msearch request
+MSEARCH_MAX_SEARCHES = int(os.environ.get("ELASTIC_MSEARCH_MAX_SEARCHES", 500))
+# Max number of msearch requests in flight for each AsyncElastic client
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("ELASTIC_ASYNC_MAX_CONCURRENCY", 8))
+# Batches are split in msearch requests of this size, sent concurrently by AsyncElastic
+ASYNC_MSEARCH_CHUNK_SIZE = int(os.environ.get("ELASTIC_ASYNC_MSEARCH_CHUNK_SIZE", 60))
+# Search only the category indexes that can hold entities of the requested types
+TYPE_ROUTING_ENABLED = os.environ.get("ELASTIC_TYPE_ROUTING_ENABLED", "true").lower() == "true"
+# Seconds the client waits past the timeout of a search with one (fallback tiers) for its partial hits
+MSEARCH_TIMEOUT_GRACE = float(os.environ.get("ELASTIC_MSEARCH_TIMEOUT_GRACE", 0.1))
+QID_PATTERN = re.compile(r"^Q\d+$")
 
 # Load index mappings
 with open("index_mappings.json") as f:
     indexes_mappings = json.loads(f.read())
 
 
+def type_qids(types):
+    # the QIDs of a space-separated types string: the free-text types (e.g. "Scientist Person") are left out
+    if types is None:
+        return []
+    return [type_id for type_id in types.split(" ") if QID_PATTERN.match(type_id)]
+
+
 # Function to fetch the certificate fingerprint
 def get_certificate_fingerprint():
     bashCommand = """
@@ -56,9 +77,26 @@ print("Fetching certificate fingerprint...", flush=True)
 
 class Elastic:
     def __init__(self, timeout=120):
-        self._elastic = self.connect_to_elasticsearch()
+        self._client = None
         self._timeout = timeout
 
+    @property
+    def _elastic(self):
+        # the client is created on first use
+        if self._client is None:
+            self._client = self.connect_to_elasticsearch()
+        return self._client
+
+    @_elastic.setter
+    def _elastic(self, client):
+        self._client = client
+
+    def is_ready(self):
+        try:
+            return bool(self._elastic.ping())
+        except Exception:
+            return False
+
     def connect_to_elasticsearch(self):
         return Elasticsearch(
             hosts=f"http://{ELASTIC_ENDPOINT}:{ELASTIC_PORT}",
@@ -67,17 +105,91 @@ class Elastic:
             # ssl_assert_fingerprint=CERT_FINGERPRINT
         )
 
-    def get_index(self, kg):
+    def get_index(self, kg, types=None):
         indexes_to_filter_out = set(indexes_mappings[kg]["indexes_to_filter_out"])
         indexes = indexes_mappings[kg]["indexes"]
-        indexes_to_consider = [indexes[category] for category in indexes if category not in indexes_to_filter_out]
+        categories = self.route_types(kg, types)
+        if categories is None:
+            categories = indexes
+        indexes_to_consider = [
+            indexes[category] for category in indexes if category not in indexes_to_filter_out and category in categories
+        ]
         return indexes_to_consider
 
-    def search(self, body, kg="wikidata", limit=100):
-        self._index_name = self.get_index(kg)
+    def route_types(self, kg, types):
+        # elastic_indexing.py puts an entity in the first category of types_by_index matching one of
+        # its P31 types, so an entity of type t can only be in the category of t or in an earlier one
+        # (or in the indexes assigned by item category). None means that every index must be searched.
+        if not TYPE_ROUTING_ENABLED or types is None or "types_by_index" not in indexes_mappings[kg]:
+            return None
+        types = type_qids(types)
+        if len(types) == 0:
+            return None
+
+        categories = list(indexes_mappings[kg]["types_by_index"].items())
+        routed = set(indexes_mappings[kg].get("category_indexes", []))
+        for type_id in types:
+            position = next((i for i, (_, category_types) in enumerate(categories) if type_id in category_types), None)
+            if position is None:
+                # entities of the other types can be in "other" too
+                return None
+            routed.update(category for category, _ in categories[: position + 1])
+        return routed
+
+    def search(self, body, kg="wikidata", limit=100, types=None):
+        self._index_name = self.get_index(kg, types)
 
         query_result = self._elastic.search(index=self._index_name, query=body["query"], size=limit)
 
+        return self.parse_hits(query_result, kg)
+
+    def msearch(self, searches, kg="wikidata", timeout=None):
+        # searches is a list of (body, limit, types) tuples, types routes the search to the
+        # matching indexes (None searches all of them); the results are returned in the same order.
+        # With a timeout (seconds) the searches return the hits found by then, and the ones
+        # that do not answer in time none
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        results = []
+        for start in range(0, len(searches), MSEARCH_MAX_SEARCHES):
+            chunk = searches[start : start + MSEARCH_MAX_SEARCHES]
+            if deadline is None:
+                query_results = self._elastic.msearch(searches=self.msearch_payload(chunk, kg))
+                results.extend(self.parse_responses(query_results, kg))
+                continue
+            remaining = deadline - time.perf_counter()
+            query_results = None
+            if remaining > 0:
+                try:
+                    query_results = self._elastic.options(request_timeout=remaining + MSEARCH_TIMEOUT_GRACE).msearch(
+                        searches=self.msearch_payload(chunk, kg, remaining)
+                    )
+                except ConnectionTimeout:
+                    pass
+            if query_results is None:
+                results.extend(([], {}) for _ in chunk)
+            else:
+                results.extend(self.parse_responses(query_results, kg))
+        return results
+
+    def msearch_payload(self, searches, kg, timeout=None):
+        payload = []
+        for body, limit, types in searches:
+            payload.append({"index": self.get_index(kg, types)})
+            search = {"query": body["query"], "size": limit}
+            if timeout is not None:
+                search["timeout"] = f"{max(int(timeout * 1000), 1)}ms"
+            payload.append(search)
+        return payload
+
+    def parse_responses(self, query_results, kg="wikidata"):
+        results = []
+        for query_result in query_results["responses"]:
+            if "error" in query_result:
+                raise RuntimeError(f"msearch error: {query_result['error']}")
+            results.append(self.parse_hits(query_result, kg))
+        return results
+
+    def parse_hits(self, query_result, kg="wikidata"):
         hits = query_result["hits"]["hits"]
         max_score = query_result["hits"]["max_score"]
         if len(hits) == 0:
@@ -104,3 +216,60 @@ class Elastic:
                 index_sources[hit["_source"]["id"]] = hit["_index"]
 
         return new_hits, index_sources
+
+
+class AsyncElastic(Elastic):
+    # Same queries as Elastic, issued with AsyncElasticsearch: the msearch chunks of a
+    # batch run concurrently, bounded by a semaphore shared by all the requests
+
+    def __init__(self, timeout=120, max_concurrency=ASYNC_MAX_CONCURRENCY, chunk_size=ASYNC_MSEARCH_CHUNK_SIZE):
+        super().__init__(timeout=timeout)
+        self._max_concurrency = max_concurrency
+        self._chunk_size = chunk_size
+        self._semaphore = None
+
+    def connect_to_elasticsearch(self):
+        return AsyncElasticsearch(
+            hosts=f"http://{ELASTIC_ENDPOINT}:{ELASTIC_PORT}",
+            request_timeout=60,
+            basic_auth=(ELASTIC_USER, ELASTIC_PW),
+        )
+
+    async def search(self, body, kg="wikidata", limit=100, types=None):
+        return (await self.msearch([(body, limit, types)], kg))[0]
+
+    async def msearch(self, searches, kg="wikidata", timeout=None):
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        chunks = [searches[start : start + self._chunk_size] for start in range(0, len(searches), self._chunk_size)]
+        results = await asyncio.gather(*[self._msearch_chunk(chunk, kg, deadline) for chunk in chunks])
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def _msearch_chunk(self, searches, kg, deadline=None):
+        if self._semaphore is None:
+            # created lazily, inside the running event loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        async with self._semaphore:
+            if deadline is None:
+                query_results = await self._elastic.msearch(searches=self.msearch_payload(searches, kg))
+            else:
+                # the time waited for the semaphore counts against the budget
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return [([], {}) for _ in searches]
+                try:
+                    query_results = await self._elastic.options(
+                        request_timeout=remaining + MSEARCH_TIMEOUT_GRACE
+                    ).msearch(searches=self.msearch_payload(searches, kg, remaining))
+                except ConnectionTimeout:
+                    return [([], {}) for _ in searches]
+        return self.parse_responses(query_results, kg)
+
+    async def is_ready(self):
+        try:
+            return bool(await self._elastic.ping())
+        except Exception:
+            return False
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
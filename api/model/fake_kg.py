@@ -0,0 +1,234 @@
+import gzip
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+
+import bson
+from faker import Faker
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+FAKE_DB_NAME = "fake"  # Name of the fake database
+# Fixed seed, every bootstrap generates the same fake KG
+FAKE_DB_SEED = int(os.environ.get("FAKE_DB_SEED", 42))
+FAKE_DB_SIZE = int(os.environ.get("FAKE_DB_SIZE", 10000))
+FAKE_DB_BATCH = int(os.environ.get("FAKE_DB_BATCH", 1000))
+# gzipped BSON snapshot written by scripts/fake_db_bootstrap.py, restored instead of generating the data
+FAKE_DB_SNAPSHOT = os.environ.get("FAKE_DB_SNAPSHOT", "")
+# A bootstrap that has not finished after this many seconds is considered dead and taken over
+FAKE_DB_LOCK_TIMEOUT = int(os.environ.get("FAKE_DB_LOCK_TIMEOUT", 3600))
+
+COLLECTIONS = ("cache", "items", "literals", "mappings", "objects", "types")
+LOCK_ID = "fake_db_bootstrap"
+
+
+def bootstrap_fake_db(mongo, snapshot=FAKE_DB_SNAPSHOT):
+    # Creates the fake KG once: the worker that acquires the lock document in the metadata
+    # collection populates it, the others (and the next starts) find it DOING or DONE and skip it.
+    # Returns True when this call populated the database.
+    fake_db = mongo[FAKE_DB_NAME]
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if not acquire_lock(fake_db, owner):
+        return False
+
+    start = time.perf_counter()
+    done = False
+    try:
+        for collection in COLLECTIONS:
+            fake_db[collection].delete_many({})
+        if snapshot and os.path.exists(snapshot):
+            restore_snapshot(fake_db, snapshot)
+        else:
+            populate_fake_db(fake_db)
+        fake_db["metadata"].update_one({"_id": LOCK_ID}, {"$set": {"status": "DONE", "finishedAt": datetime.utcnow()}})
+        done = True
+    finally:
+        if not done:
+            release_lock(fake_db, owner)
+    print(f"Fake database initialized and populated in {time.perf_counter() - start:.1f}s.", flush=True)
+    return True
+
+
+def release_lock(fake_db, owner):
+    # a failed bootstrap gives the lock back, the next start tries again instead of waiting for the timeout
+    try:
+        fake_db["metadata"].delete_one({"_id": LOCK_ID, "status": "DOING", "owner": owner})
+    except PyMongoError as e:
+        print(f"Fake database lock not released: {e}", flush=True)
+
+
+def acquire_lock(fake_db, owner):
+    metadata = fake_db["metadata"]
+    now = datetime.utcnow()
+    if metadata.find_one({"_id": LOCK_ID}) is None and fake_db["items"].estimated_document_count() > 0:
+        # populated before the lock existed
+        metadata.update_one({"_id": LOCK_ID}, {"$setOnInsert": {"status": "DONE", "finishedAt": now}}, upsert=True)
+        return False
+    try:
+        metadata.insert_one({"_id": LOCK_ID, "status": "DOING", "owner": owner, "startedAt": now})
+        return True
+    except DuplicateKeyError:
+        pass
+    # the bootstrap of a dead worker is taken over once it is older than the timeout
+    stale = metadata.find_one_and_update(
+        {"_id": LOCK_ID, "status": "DOING", "startedAt": {"$lt": now - timedelta(seconds=FAKE_DB_LOCK_TIMEOUT)}},
+        {"$set": {"owner": owner, "startedAt": now}},
+    )
+    return stale is not None
+
+
+def populate_fake_db(fake_db, seed=FAKE_DB_SEED, size=FAKE_DB_SIZE):
+    for collection, documents in generate_documents(seed, size):
+        insert_batches(fake_db[collection], documents)
+
+
+def insert_batches(collection, documents, batch_size=FAKE_DB_BATCH):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if len(batch) > 0:
+        collection.insert_many(batch, ordered=False)
+
+
+def generate_documents(seed, size):
+    fake = Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+    yield "cache", generate_cache(fake, rng, size)
+    yield "items", generate_items(fake, rng, size)
+    yield "literals", generate_literals(fake, rng, size)
+    yield "mappings", generate_mappings(fake, rng, size)
+    yield "objects", generate_objects(fake, rng, size)
+    yield "types", generate_types(fake, rng, size)
+
+
+def generate_cache(fake, rng, size):
+    # one entry per cell, as in the candidate cache
+    cells = set()
+    for _ in range(size):
+        word = fake.word()
+        if word in cells:
+            continue
+        cells.add(word)
+        yield {
+            "cell": word,
+            "type": None,
+            "kg": "fake",
+            "candidates": [{
+                "id": fake.random_number(digits=5),
+                "name": fake.name(),
+                "description": fake.sentence(),
+                "types": [{"id": fake.random_number(digits=5), "name": fake.word()}],
+                "ambiguity_mention": rng.uniform(0, 1),
+                "corrects_tokens": rng.uniform(0, 1),
+                "ntoken_mention": rng.randint(1, 5),
+                "ntoken_entity": rng.randint(1, 5),
+                "length_mention": rng.randint(1, 10),
+                "length_entity": rng.randint(1, 10),
+                "popularity": rng.uniform(0, 1),
+                "pos_score": rng.uniform(0, 1),
+                "es_score": rng.uniform(0, 1),
+                "ed_score": rng.uniform(0, 1),
+                "jaccard_score": rng.uniform(0, 1),
+                "jaccardNgram_score": rng.uniform(0, 1),
+                "cosine_similarity": rng.uniform(0, 1)
+            } for _ in range(rng.randint(1, 100))],  # Random number of candidates
+            "lastAccessed": datetime.utcnow(),
+            "fuzzy": False,
+            "limit": 100,
+            "query": {"query": {"match": {"name": word}}}
+        }
+
+
+def generate_items(fake, rng, size):
+    for _ in range(size):
+        yield {
+            "id_entity": fake.random_number(digits=5),
+            "entity": fake.word(),
+            "description": {"language": "en", "value": fake.sentence()},
+            "labels": {fake.language_code(): fake.word() for _ in range(rng.randint(1, 5))},
+            "aliases": {
+                fake.language_code(): [fake.word() for _ in range(rng.randint(1, 3))] for _ in range(rng.randint(1, 5))
+            },
+            "types": {
+                "P31": [f'Q{fake.random_number(digits=5)}' for _ in range(rng.randint(1, 3))]
+                for _ in range(rng.randint(1, 5))
+            },
+            "popularity": rng.randint(1, 1000),
+            "category": "entity"
+        }
+
+
+def generate_literals(fake, rng, size):
+    for _ in range(size):
+        yield {
+            "id_entity": fake.random_number(digits=5),
+            "entity": fake.word(),
+            "literals": {
+                "GEOSHAPE": {"P" + str(fake.random_number(digits=5)): [fake.word()]},
+                "DATETIME": {"P" + str(fake.random_number(digits=5)): [fake.iso8601()]},
+                "MUSICAL_NOTATION": {},
+                "TABULAR_DATA": {},
+                "MATH": {},
+                "NUMBER": {"P" + str(fake.random_number(digits=5)): [str(fake.random_number(digits=8))]},
+                "STRING": {"P" + str(fake.random_number(digits=5)): [fake.word()]}
+            }
+        }
+
+
+def generate_mappings(fake, rng, size):
+    for _ in range(size):
+        yield {
+            "curid": str(fake.random_number(digits=5)),
+            "wikipedia_id": fake.word(),
+            "wikidata_id": "Q" + str(fake.random_number(digits=5)),
+            "dbpedia_id": fake.word()
+        }
+
+
+def generate_objects(fake, rng, size):
+    for _ in range(size):
+        yield {
+            "id_entity": fake.random_number(digits=5),
+            "entity": "Q" + str(fake.random_number(digits=5)),
+            "objects": {
+                "Q" + str(fake.random_number(digits=5)): ["P" + str(fake.random_number(digits=5))]
+            }
+        }
+
+
+def generate_types(fake, rng, size):
+    for _ in range(size):
+        yield {
+            "id_entity": fake.random_number(digits=5),
+            "entity": "Q" + str(fake.random_number(digits=5)),
+            "types": {
+                "P" + str(fake.random_number(digits=5)): ["Q" + str(fake.random_number(digits=5))]
+            }
+        }
+
+
+def write_snapshot(fake_db, path):
+    # every record is {"c": collection, "d": document}, in a single gzipped BSON stream
+    with gzip.open(path, "wb") as f:
+        for collection in COLLECTIONS:
+            for document in fake_db[collection].find({}, {"_id": 0}):
+                f.write(bson.encode({"c": collection, "d": document}))
+
+
+def restore_snapshot(fake_db, path):
+    batches = {}
+    with gzip.open(path, "rb") as f:
+        for record in bson.decode_file_iter(f):
+            batch = batches.setdefault(record["c"], [])
+            batch.append(record["d"])
+            if len(batch) >= FAKE_DB_BATCH:
+                fake_db[record["c"]].insert_many(batch, ordered=False)
+                batches[record["c"]] = []
+    for collection, batch in batches.items():
+        if len(batch) > 0:
+            fake_db[collection].insert_many(batch, ordered=False)
@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+L1_CACHE_ENABLED = os.environ.get("L1_CACHE_ENABLED", "true").lower() == "true"
+# Byte budget of the cached values, the least recently used ones are evicted first
+L1_CACHE_MAX_BYTES = int(os.environ.get("L1_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+# When set (e.g. /dev/shm/lamapi-l1.sqlite) the cache lives in a file shared by all the
+# gunicorn workers, otherwise every worker keeps its own copy in memory
+L1_CACHE_PATH = os.environ.get("L1_CACHE_PATH", "")
+
+
+def make_key(*parts):
+    return json.dumps(parts, separators=(",", ":"))
+
+
+class LocalLRUCache:
+
+    def __init__(self, max_bytes=L1_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return json.loads(value)
+
+    def put(self, key, value):
+        value = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(key) + len(old)
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_bytes:
+                old_key, old = self._entries.popitem(last=False)
+                self._size -= len(old_key) + len(old)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({"backend": "local", "entries": len(self._entries), "bytes": self._size})
+        return stats
+
+
+class SharedLRUCache:
+    # SQLite database on a memory-backed file (e.g. /dev/shm): a single copy of the hot set
+    # is shared by every worker process, SQLite takes care of the locking between them
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)",
+        "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)",
+        "CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)",
+        "INSERT OR IGNORE INTO meta (id, total) VALUES (0, 0)",
+        "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+        "BEGIN UPDATE meta SET total = total + new.size WHERE id = 0; END",
+        "CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries "
+        "BEGIN UPDATE meta SET total = total + new.size - old.size WHERE id = 0; END",
+        "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+        "BEGIN UPDATE meta SET total = total - old.size WHERE id = 0; END",
+    ]
+    EVICTION_BATCH = 100
+
+    def __init__(self, path=L1_CACHE_PATH, max_bytes=L1_CACHE_MAX_BYTES, timeout=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+    def _connection(self):
+        # connections are opened lazily, so that every worker (and thread) gets its own after fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error:
+            self._count("errors")
+            return None
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        value = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, accessed = excluded.accessed",
+                (key, value, size, time.time()),
+            )
+            self._evict(connection)
+        except sqlite3.Error:
+            self._count("errors")
+
+    def _evict(self, connection):
+        excess = connection.execute("SELECT total FROM meta WHERE id = 0").fetchone()[0] - self.max_bytes
+        while excess > 0:
+            keys = []
+            for key, size in connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT ?", (self.EVICTION_BATCH,)
+            ):
+                keys.append(key)
+                excess -= size
+                if excess <= 0:
+                    break
+            if len(keys) == 0:
+                break
+            connection.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+            self._count("evictions", len(keys))
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM entries")
+        except sqlite3.Error:
+            self._count("errors")
+
+    def _count(self, stat, value=1):
+        with self._lock:
+            self.stats[stat] += value
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["backend"] = "shared"
+        try:
+            connection = self._connection()
+            stats["entries"] = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            stats["bytes"] = connection.execute("SELECT total FROM meta WHERE id = 0").fetchone()[0]
+        except sqlite3.Error:
+            self._count("errors")
+        return stats
+
+
+def create_l1_cache():
+    if not L1_CACHE_ENABLED:
+        return None
+    if L1_CACHE_PATH:
+        return SharedLRUCache()
+    return LocalLRUCache()
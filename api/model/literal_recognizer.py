@@ -1,4 +1,11 @@
+import os
 import re
+from functools import lru_cache
+
+# Classifications memoized per process (repeated cell values are classified once)
+LITERAL_CACHE_SIZE = int(os.environ.get("LITERAL_CACHE_SIZE", 100000))
+
+
 class LiteralRecognizer():
     
     # PATTERN TO MATCH DATES
@@ -69,12 +76,53 @@ class LiteralRecognizer():
     
     literal_types = {'datetime': datetime_pattern_to_match, 'time': time_pattern_to_match, 'url': url_pattern_to_match, 'email': email_pattern_to_match, 'float': float_pattern_to_match, 'integer': integer_pattern_to_match, 'date': date_pattern_to_match}
     
+    # priority order of the literal types, the first matching one classifies the token
+    LITERAL_PATTERNS = {'datetime': DATETIME_PATTERN, 'time': TIME_PATTERN, 'url': URL_PATTERN, 'email': EMAIL_PATTERN, 'float': FLOAT_NUMBER, 'integer': INTEGER_NUMBER, 'date': DATE_PATTERN}
+
     @classmethod
     # check literals
     def check_literal(self, token):
-        for key in self.literal_types:
-            matches = self.literal_types[key].finditer(token)
-            list_of_matches = list(matches)
-            if len(list_of_matches) > 0:
-                return key.upper()
-        return 'STRING'
\ No newline at end of file
+        return _classify(token)
+
+    @classmethod
+    # check a list of literals, in one call (e.g. on the CPU pool)
+    def check_literals(self, tokens):
+        classifications = {token: _classify(token) for token in set(tokens)}
+        return [classifications[token] for token in tokens]
+
+
+def _compile_automata():
+    # All the patterns in a single alternation, one named group per literal type in priority order:
+    # one match at the start of the token gives the first type whose pattern matches, like checking
+    # the patterns one by one. Cheap character checks select the automaton without the patterns that
+    # cannot match: every type but URL and EMAIL needs a digit, URL needs a dot, EMAIL a dot and an @.
+    automata = {}
+    for has_digit in (False, True):
+        for has_dot in (False, True):
+            for has_at in (False, True):
+                keys = [
+                    key for key in LiteralRecognizer.LITERAL_PATTERNS
+                    if (has_digit or key in ('url', 'email'))
+                    and (has_dot or key not in ('url', 'email'))
+                    and (has_at or key != 'email')
+                ]
+                alternation = "|".join(f"(?P<{key}>{LiteralRecognizer.LITERAL_PATTERNS[key]})" for key in keys)
+                automata[(has_digit, has_dot, has_at)] = re.compile(alternation, re.IGNORECASE) if keys else None
+    return automata
+
+
+AUTOMATA = _compile_automata()
+
+
+def _classify_uncached(token):
+    automaton = AUTOMATA[(
+        any(char.isdigit() for char in token), "." in token, "@" in token
+    )]
+    if automaton is not None:
+        match = automaton.match(token)
+        if match is not None:
+            return match.lastgroup.upper()
+    return 'STRING'
+
+
+_classify = lru_cache(maxsize=LITERAL_CACHE_SIZE)(_classify_uncached)
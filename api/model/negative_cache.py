@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+NEGATIVE_CACHE_ENABLED = os.environ.get("NEGATIVE_CACHE_ENABLED", "true").lower() == "true"
+# Seconds a lookup without candidates is remembered, much shorter than the candidate cache TTL
+NEGATIVE_CACHE_TTL = int(os.environ.get("NEGATIVE_CACHE_TTL", 24 * 3600))
+# Max number of negative entries kept in memory by each worker
+NEGATIVE_CACHE_LOCAL_SIZE = int(os.environ.get("NEGATIVE_CACHE_LOCAL_SIZE", 100000))
+
+# the limit is not part of the key: a lookup without hits has none at any limit
+KEY_FIELDS = ("cell", "kg", "fuzzy", "type")
+
+
+class NegativeCache:
+    # Lookups that returned no candidates, kept in memory and in the "negative_cache" collection
+    # of the KG database. Entries expire after their own TTL, and the in-memory ones of a KG are
+    # dropped when the KG switches to a new database (whose collection starts empty).
+
+    def __init__(self, database, ttl=NEGATIVE_CACHE_TTL, local_size=NEGATIVE_CACHE_LOCAL_SIZE):
+        self.database = database
+        self.ttl = ttl
+        self.local_size = local_size
+        self._local = OrderedDict()
+        self._initialized = set()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "inserts": 0, "invalidations": 0}
+        database.add_mappings_listener(self._on_mappings_change)
+
+    def _on_mappings_change(self, kg, old_db_name, new_db_name):
+        with self._lock:
+            keys = [key for key in self._local if key[1] == kg]
+            for key in keys:
+                del self._local[key]
+            self.stats["invalidations"] += len(keys)
+
+    def get_collection(self, kg):
+        collection = self.database.get_requested_collection("negative_cache", kg=kg)
+        if collection.full_name not in self._initialized:
+            collection.create_index([(field, 1) for field in KEY_FIELDS], unique=True)
+            try:
+                collection.create_index([("createdAt", 1)], expireAfterSeconds=self.ttl)
+            except OperationFailure:
+                collection.database.command(
+                    "collMod", collection.name, index={"keyPattern": {"createdAt": 1}, "expireAfterSeconds": self.ttl}
+                )
+            self._initialized.add(collection.full_name)
+        return collection
+
+    def _key(self, lookup):
+        return tuple(lookup[field] for field in KEY_FIELDS)
+
+    def contains_many(self, lookups, kg):
+        # positions in lookups of the known empty lookups
+        found = set()
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for i, lookup in enumerate(lookups):
+                expiry = self._local.get(self._key(lookup))
+                if expiry is not None and expiry > now:
+                    found.add(i)
+                else:
+                    missing.append(i)
+
+        if len(missing) > 0:
+            collection = self.get_collection(kg)
+            query = {"$or": [dict(zip(KEY_FIELDS, key)) for key in {self._key(lookups[i]) for i in missing}]}
+            # MongoDB removes expired documents only once a minute
+            query["createdAt"] = {"$gt": datetime.utcnow() - timedelta(seconds=self.ttl)}
+            stored = {}
+            for document in collection.find(query, {field: 1 for field in KEY_FIELDS + ("createdAt",)}):
+                stored[tuple(document.get(field) for field in KEY_FIELDS)] = document["createdAt"]
+            for i in missing:
+                created_at = stored.get(self._key(lookups[i]))
+                if created_at is not None:
+                    found.add(i)
+                    remaining = self.ttl - (datetime.utcnow() - created_at).total_seconds()
+                    self._remember(self._key(lookups[i]), now + remaining)
+
+        with self._lock:
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(lookups) - len(found)
+        return found
+
+    def contains(self, lookup):
+        return len(self.contains_many([lookup], lookup["kg"])) > 0
+
+    def add_many(self, lookups, kg):
+        if len(lookups) == 0:
+            return
+        now = time.monotonic()
+        for lookup in lookups:
+            self._remember(self._key(lookup), now + self.ttl)
+        created_at = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {field: lookup[field] for field in KEY_FIELDS}, {"$set": {"createdAt": created_at}}, upsert=True
+            )
+            for lookup in lookups
+        ]
+        self.get_collection(kg).bulk_write(operations, ordered=False)
+        with self._lock:
+            self.stats["inserts"] += len(lookups)
+
+    def add(self, lookup):
+        self.add_many([lookup], lookup["kg"])
+
+    def _remember(self, key, expiry):
+        with self._lock:
+            self._local[key] = expiry
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["local_entries"] = len(self._local)
+        return stats
@@ -0,0 +1,119 @@
+import os
+import threading
+
+import spacy
+
+from model.cpu_executor import CpuExecutor
+
+SPACY_MODEL = os.environ.get("SPACY_MODEL", "en_core_web_sm")
+# Only the NER component is used, the other components are not loaded
+SPACY_EXCLUDE = [
+    component.strip()
+    for component in os.environ.get("SPACY_EXCLUDE", "tagger,parser,senter,attribute_ruler,lemmatizer").split(",")
+    if component.strip()
+]
+# Texts per nlp.pipe batch, and nlp.pipe processes (per pool process)
+NLP_BATCH_SIZE = int(os.environ.get("NLP_BATCH_SIZE", 256))
+NLP_N_PROCESS = int(os.environ.get("NLP_N_PROCESS", 1))
+# Processes of the dedicated NLP pool, 0 runs the inference in the worker itself. Every worker has its own
+# pool, so each pool process loads a model: with GUNICORN_PRELOAD the default is 0 and the workers share
+# the model loaded by the master
+GUNICORN_PRELOAD = os.environ.get("GUNICORN_PRELOAD", "false").lower() == "true"
+NLP_POOL_SIZE = int(os.environ.get("NLP_POOL_SIZE") or (0 if GUNICORN_PRELOAD else 1))
+
+
+class ModelRegistry:
+    # One pipeline per model and per process, loaded on first use and shared by every service.
+    # When gunicorn preloads the app the models are loaded in the master, and the workers share
+    # their (read-only) pages copy-on-write.
+
+    def __init__(self, exclude=SPACY_EXCLUDE):
+        self.exclude = exclude
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, name=SPACY_MODEL):
+        nlp = self._models.get(name)
+        if nlp is None:
+            with self._lock:
+                nlp = self._models.get(name)
+                if nlp is None:
+                    nlp = self._load(name)
+                    self._models[name] = nlp
+        return nlp
+
+    def _load(self, name):
+        nlp = spacy.load(name, exclude=self.exclude)
+        # the shared tok2vec is useless once the components listening to it are excluded
+        if "tok2vec" in nlp.pipe_names and len(nlp.get_pipe("tok2vec").listening_components) == 0:
+            nlp.remove_pipe("tok2vec")
+        print(f"Loaded spaCy model {name} with components {nlp.pipe_names}", flush=True)
+        return nlp
+
+    def is_loaded(self, name=SPACY_MODEL):
+        return name in self._models
+
+    def preload(self, names=(SPACY_MODEL,)):
+        for name in names:
+            self.get(name)
+
+
+model_registry = ModelRegistry()
+
+
+def get_nlp():
+    return model_registry.get()
+
+
+def preload_models():
+    # initializer of the NLP pool processes: a module-level function, the registry (and its lock)
+    # cannot be pickled to the spawned processes
+    model_registry.preload()
+
+
+def pipe_entities(texts, batch_size=NLP_BATCH_SIZE, n_process=NLP_N_PROCESS):
+    # (mention, label, start_char, end_char) of the entities of every text, in the current process
+    return [
+        [(ent.text, ent.label_, ent.start_char, ent.end_char) for ent in doc.ents]
+        for doc in get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+    ]
+
+
+class NLPPool:
+    # The spaCy inference runs on its own CPU executor, whose processes load the model once at start.
+
+    def __init__(self, size=NLP_POOL_SIZE, batch_size=NLP_BATCH_SIZE):
+        self.size = size
+        self.batch_size = batch_size
+        self.executor = CpuExecutor("nlp", size=size, min_items=0, initializer=preload_models)
+        self._ready = False
+
+    def extract_entities(self, texts):
+        texts = list(texts)
+        if len(texts) == 0:
+            return []
+        # large requests are split across the pool processes, in chunks of whole batches
+        chunk_size = max(self.batch_size, -(-len(texts) // max(self.size, 1)))
+        chunks = [(texts[i:i + chunk_size], self.batch_size) for i in range(0, len(texts), chunk_size)]
+        entities = []
+        for result in self.executor.map(pipe_entities, chunks):
+            entities.extend(result)
+        self._ready = True
+        return entities
+
+    def warm_up(self):
+        # loads the model where the inference runs (the pool processes, or the worker)
+        self.extract_entities([""])
+
+    def is_ready(self):
+        return self._ready
+
+    def get_stats(self):
+        return self.executor.get_stats()
+
+
+nlp_pool = NLPPool()
+
+
+def extract_entities(texts):
+    return nlp_pool.extract_entities(texts)
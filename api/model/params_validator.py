@@ -43,4 +43,55 @@ class ParamsValidator():
             else:
                 return False, build_error("Bool parameter cannot be converted", 400)
         else:
-            return True, False
\ No newline at end of file
+            return True, False
+
+    def validate_lookup_cells(self, cells):
+        if not isinstance(cells, list) or len(cells) == 0:
+            return False, build_error("Cells must be a non-empty list", 400)
+
+        validated_cells = []
+        parameters = {}
+        for cell in cells:
+            if not isinstance(cell, dict) or not isinstance(cell.get("name"), str):
+                return False, build_error("Each cell must be an object with a 'name' string", 400)
+
+            fuzzy = cell.get("fuzzy")
+            if isinstance(fuzzy, bool):
+                fuzzy = str(fuzzy)
+            is_fuzzy_valid, fuzzy_value = self.validate_bool(fuzzy)
+            if not is_fuzzy_valid:
+                return False, fuzzy_value
+
+            limit_is_valid, limit_error_or_value = self.validate_limit(cell.get("limit"))
+            if not limit_is_valid:
+                return False, limit_error_or_value
+
+            types = cell.get("types")
+            if isinstance(types, list):
+                types = " ".join(types)
+
+            ids = cell.get("ids")
+            if isinstance(ids, list):
+                ids = " ".join(ids)
+
+            # the results are keyed by the normalized name: a name repeated with other parameters
+            # would overwrite the candidates of its first occurrence
+            name = cell["name"].strip().lower()
+            cell_parameters = (
+                limit_error_or_value,
+                fuzzy_value,
+                " ".join(sorted(types.split(" "))) if types is not None else None,
+                ids,
+            )
+            if parameters.setdefault(name, cell_parameters) != cell_parameters:
+                return False, build_error(f"Cell '{name}' is repeated with different parameters", 400)
+
+            validated_cells.append({
+                "name": cell["name"],
+                "limit": limit_error_or_value,
+                "fuzzy": fuzzy_value,
+                "types": types,
+                "ids": ids
+            })
+
+        return True, validated_cells
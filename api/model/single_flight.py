@@ -0,0 +1,64 @@
+import threading
+
+
+class Call:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Coalesces identical concurrent work: the first caller of a key (the leader) does it,
+    # the callers arriving while it is in flight wait for it and share its result.
+    # threading primitives are cooperative under gevent's monkey patching.
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def begin(self, key):
+        # returns (call, True) when the caller must do the work and then finish(), (call, False) otherwise
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats["coalesced"] += 1
+                return call, False
+            call = Call()
+            self._calls[key] = call
+            self.stats["leaders"] += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.event.set()
+
+    def wait(self, call):
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, function):
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call)
+        try:
+            result = function()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
@@ -0,0 +1,131 @@
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+TYPE_LABEL_REGISTRY_ENABLED = os.environ.get("TYPE_LABEL_REGISTRY_ENABLED", "true").lower() == "true"
+
+
+class TypeLabelTable:
+    # English labels of the type items of one KG database: the numeric part of the QIDs
+    # is kept sorted in an integer array, and the labels in a single UTF-8 string table
+    # addressed by offsets, which is far smaller than a dict of millions of str objects
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._ids = array("Q")
+        self._offsets = array("Q", [0])
+        self._labels = bytearray()
+        self._others = {}
+
+    def load(self, items_collection):
+        ids, offsets, labels = array("Q"), array("Q"), bytearray()
+        cursor = items_collection.find({"category": "type"}, {"_id": 0, "entity": 1, "labels.en": 1})
+        for item in cursor:
+            entity = item["entity"]
+            label = item.get("labels", {}).get("en")
+            if entity[:1] != "Q" or not entity[1:].isdigit():
+                self._others[entity] = label
+                continue
+            ids.append(int(entity[1:]))
+            offsets.append(len(labels))
+            labels.extend((label or "").encode("utf-8"))
+        offsets.append(len(labels))
+
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        for i in order:
+            self._ids.append(ids[i])
+            self._labels.extend(labels[offsets[i] : offsets[i + 1]])
+            self._offsets.append(len(self._labels))
+        self._labels = bytes(self._labels)
+        return self
+
+    def get(self, entity):
+        if entity[:1] != "Q" or not entity[1:].isdigit():
+            return self._others.get(entity)
+        qid = int(entity[1:])
+        i = bisect_left(self._ids, qid)
+        if i == len(self._ids) or self._ids[i] != qid:
+            return None
+        label = self._labels[self._offsets[i] : self._offsets[i + 1]]
+        return label.decode("utf-8") if len(label) > 0 else None
+
+    def __len__(self):
+        return len(self._ids) + len(self._others)
+
+    def nbytes(self):
+        return (
+            self._ids.itemsize * len(self._ids)
+            + self._offsets.itemsize * len(self._offsets)
+            + len(self._labels)
+        )
+
+
+class TypeLabelRegistry:
+
+    def __init__(self, database):
+        self.database = database
+        self._tables = {}
+        self._loading = set()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "fallbacks": 0, "loads": 0}
+        database.add_mappings_listener(self._on_mappings_change)
+
+    def _on_mappings_change(self, kg, old_db_name, new_db_name):
+        if new_db_name is not None:
+            self._load_async(kg, new_db_name)
+
+    def _load_async(self, kg, db_name):
+        with self._lock:
+            if (kg, db_name) in self._loading:
+                return
+            self._loading.add((kg, db_name))
+        threading.Thread(target=self._load, args=(kg, db_name), daemon=True).start()
+
+    def _load(self, kg, db_name):
+        try:
+            table = TypeLabelTable(db_name).load(self.database.mongo[db_name]["items"])
+            # a newer dump may have been activated while loading. The mappings are read before taking
+            # the lock: they can wait for the database initialization, which notifies the listeners
+            # and so takes the lock too
+            active = self.database.mappings.get(kg) == db_name
+            with self._lock:
+                if active:
+                    self._tables[kg] = table
+                    self.stats["loads"] += 1
+        except Exception as e:
+            print(f"Type label registry: loading {db_name} failed: {e}", flush=True)
+        finally:
+            with self._lock:
+                self._loading.discard((kg, db_name))
+
+    def get_table(self, kg):
+        # returns None until the table of the active database is loaded
+        db_name = self.database.mappings.get(kg)
+        table = self._tables.get(kg)
+        if table is not None and table.db_name == db_name:
+            return table
+        if db_name is not None:
+            self._load_async(kg, db_name)
+        return None
+
+    def is_ready(self):
+        # every KG with an active database has its table loaded
+        return all(self.get_table(kg) is not None for kg, db_name in self.database.mappings.items() if db_name is not None)
+
+    def get_labels(self, ids, kg):
+        table = self.get_table(kg)
+        with self._lock:
+            self.stats["hits" if table is not None else "fallbacks"] += 1
+        if table is None:
+            return None
+        return {id_type: table.get(id_type) for id_type in ids}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["tables"] = {
+                kg: {"db": table.db_name, "labels": len(table), "bytes": table.nbytes()}
+                for kg, table in self._tables.items()
+            }
+        return stats
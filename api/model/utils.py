@@ -1,5 +1,6 @@
 import re
 import nltk
+import numpy as np
 from model.database import Database
 
 def editdistance(s1, s2):
@@ -44,6 +45,27 @@ def clean_str(s):
     return " ".join(s.split())
 
 
+def compute_ambiguity(label, token_hits):
+    # ambiguity_mention: share of the entities returned by the token query whose name is the mention
+    # corrects_tokens: share of the mention tokens found in the names returned by the token query
+    mention_clean = clean_str(label)
+    ambiguity_mention, corrects_tokens = (0, 0)
+    history_labels, tokens_set = (set(), set())
+    for entity in token_hits:
+        label_clean = clean_str(entity["name"])
+        tokens = label_clean.split(" ")
+        for token in tokens:
+            tokens_set.add(token)
+        if mention_clean == label_clean and entity["id"] not in history_labels:
+            ambiguity_mention += 1
+        history_labels.add(entity["id"])
+    tokens_mention = set(mention_clean.split(" "))
+    ambiguity_mention = ambiguity_mention / len(history_labels) if len(history_labels) > 0 else 0
+    ambiguity_mention = round(ambiguity_mention, 3)
+    corrects_tokens = round(len(tokens_mention.intersection(tokens_set)) / len(tokens_mention), 3)
+    return ambiguity_mention, corrects_tokens
+
+
 def compute_similarity_between_string(str1, str2, ngram=None):
     ngrams_str1 = get_ngrams(str1, ngram)
     ngrams_str2 = get_ngrams(str2, ngram) 
@@ -68,6 +90,73 @@ def get_ngrams(text, n=3):
 
 
 
+class MentionScorer:
+    """ Scores a batch of candidate labels against one mention.
+
+    The mention features (characters, tokens, trigrams) are computed once, and the edit
+    distances of all the labels are computed together with NumPy. Returns the same values as
+    editdistance and compute_similarity_between_string, rounded like in the lookup.
+    """
+
+    CHUNK_SIZE = 256
+
+    def __init__(self, mention):
+        self.mention = mention
+        self.codes = np.frombuffer(mention.encode("utf-32-le"), dtype=np.uint32)
+        self.tokens = get_ngrams(mention, None)
+        self.trigrams = get_ngrams(mention, 3)
+
+    def edit_distances(self, labels):
+        # labels are sorted by length and processed in chunks, to keep padding small
+        lengths = np.array([len(label) for label in labels], dtype=np.int64)
+        distances = np.empty(len(labels), dtype=np.int64)
+        order = np.argsort(lengths, kind="stable")
+        for start in range(0, len(labels), self.CHUNK_SIZE):
+            chunk = order[start:start + self.CHUNK_SIZE]
+            distances[chunk] = self._edit_distances([labels[i] for i in chunk], lengths[chunk])
+        return distances
+
+    def _edit_distances(self, labels, lengths):
+        # Levenshtein distance, one row of the DP matrix per mention character for all the labels:
+        # cur[j] = min(prev[j] + 1, prev[j - 1] + cost[j], cur[j - 1] + 1), the last term being
+        # resolved for the whole row as a running minimum of (cur[k] - k) + j
+        width = int(lengths.max()) if len(lengths) > 0 else 0
+        columns = np.arange(width + 1)
+        codes = np.zeros((len(labels), width), dtype=np.uint32)
+        codes[columns[:width] < lengths[:, None]] = np.frombuffer("".join(labels).encode("utf-32-le"), dtype=np.uint32)
+
+        prev = np.broadcast_to(columns, (len(labels), width + 1)).copy()
+        cur = np.empty_like(prev)
+        for i, code in enumerate(self.codes, 1):
+            cost = codes != code
+            cur[:, 0] = i
+            np.minimum(prev[:, 1:] + 1, prev[:, :-1] + cost, out=cur[:, 1:])
+            cur = np.minimum.accumulate(cur - columns, axis=1) + columns
+            prev, cur = cur, prev
+        return prev[np.arange(len(labels)), lengths]
+
+    def score(self, labels):
+        # returns the (ed_score, jaccard_score, jaccardNgram_score) of every label
+        unique_labels = list(dict.fromkeys(labels))
+        distances = self.edit_distances(unique_labels).tolist()
+        length_mention = len(self.mention)
+        scores = {}
+        for label, distance in zip(unique_labels, distances):
+            tokens = get_ngrams(label, None)
+            trigrams = get_ngrams(label, 3)
+            scores[label] = (
+                round(1 - distance / max(len(label), length_mention, 1), 2),
+                round(len(tokens.intersection(self.tokens)) / max(len(tokens), len(self.tokens), 1), 2),
+                round(len(trigrams.intersection(self.trigrams)) / max(len(trigrams), len(self.trigrams), 1), 2),
+            )
+        return [scores[label] for label in labels]
+
+
+def score_mentions(mentions):
+    # scores of a batch of (mention, labels), e.g. all the lookups of a request on the CPU pool
+    return [MentionScorer(mention).score(labels) for mention, labels in mentions]
+
+
 def create_index(db):
     for kg in db.mappings:
         candidate_cache_collection = db.get_requested_collection("candidate", kg=kg)
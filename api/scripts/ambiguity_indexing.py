@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+import traceback
+
+from elasticsearch import Elasticsearch
+from pymongo import MongoClient, UpdateOne
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from model.utils import compute_ambiguity
+
+# Precomputes the ambiguity_mention and corrects_tokens statistics of LookupRetriever for a set of
+# normalized labels, so that lookups on those labels can skip the token query. The statistics are
+# computed with the same token query (size = limit) used at runtime, and stored in the "ambiguity"
+# collection of the KG database, keyed by (label, limit).
+#
+# Usage: python ambiguity_indexing.py <DATABASE NAME> [items|cache] [limit]
+#   items: the English labels of the items collection (default)
+#   cache: the cells already looked up, from the cache collection
+
+ELASTIC_USER = os.environ["ELASTICSEARCH_USERNAME"]
+ELASTIC_PW = os.environ.get("ELASTIC_PASSWORD", "")
+ELASTIC_ENDPOINT, ELASTIC_PORT = os.environ["ELASTIC_ENDPOINT"].split(":")
+BATCH = 500
+
+try:
+    db_name = sys.argv[1]
+    kg_name = "".join(filter(str.isalpha, db_name))
+    source = sys.argv[2] if len(sys.argv) > 2 else "items"
+    limit = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    if source not in ("items", "cache"):
+        raise ValueError(source)
+except Exception:
+    sys.exit("Usage: python ambiguity_indexing.py <DATABASE NAME> [items|cache] [limit]")
+
+
+def get_labels(db):
+    if source == "cache":
+        for cell in db.cache.distinct("cell"):
+            yield cell
+    else:
+        for item in db.items.find({}, {"_id": 0, "labels.en": 1}):
+            label = item.get("labels", {}).get("en")
+            if label:
+                yield label.strip().lower()
+
+
+def index_batch(es, index_name, ambiguity_c, labels):
+    payload = []
+    for label in labels:
+        payload.append({"index": index_name})
+        payload.append({"query": {"match": {"name": label}}, "size": limit, "_source": ["id", "name"]})
+    responses = es.msearch(searches=payload)["responses"]
+
+    operations = []
+    for label, response in zip(labels, responses):
+        if "error" in response:
+            print(f"Search error for '{label}': {response['error']}")
+            continue
+        token_hits = [hit["_source"] for hit in response["hits"]["hits"]]
+        ambiguity_mention, corrects_tokens = compute_ambiguity(label, token_hits)
+        operations.append(UpdateOne(
+            {"label": label, "limit": limit},
+            {"$set": {"ambiguity_mention": ambiguity_mention, "corrects_tokens": corrects_tokens}},
+            upsert=True
+        ))
+    if len(operations) > 0:
+        ambiguity_c.bulk_write(operations, ordered=False)
+
+
+try:
+    MONGO_ENDPOINT, MONGO_ENDPOINT_PORT = os.environ["MONGO_ENDPOINT"].split(":")
+    MONGO_ENDPOINT_USERNAME = os.environ["MONGO_INITDB_ROOT_USERNAME"]
+    MONGO_ENDPOINT_PASSWORD = os.environ["MONGO_INITDB_ROOT_PASSWORD"]
+    client = MongoClient(
+        MONGO_ENDPOINT, int(MONGO_ENDPOINT_PORT), username=MONGO_ENDPOINT_USERNAME, password=MONGO_ENDPOINT_PASSWORD
+    )
+    db = client[db_name]
+    ambiguity_c = db.ambiguity
+    ambiguity_c.create_index([("label", 1), ("limit", 1)], unique=True)
+
+    es = Elasticsearch(
+        hosts=f"http://{ELASTIC_ENDPOINT}:{ELASTIC_PORT}",
+        request_timeout=60,
+        max_retries=10,
+        retry_on_timeout=True,
+        basic_auth=(ELASTIC_USER, ELASTIC_PW),
+    )
+
+    # same indexes searched by the API
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "index_mappings.json")) as f:
+        index_mappings = json.loads(f.read())[kg_name]
+    indexes_to_filter_out = set(index_mappings["indexes_to_filter_out"])
+    index_name = [index for category, index in index_mappings["indexes"].items() if category not in indexes_to_filter_out]
+
+    buffer, seen = [], set()
+    for label in tqdm(get_labels(db)):
+        # labels are deduplicated within a window, repeated ones are just upserted again
+        if label in seen:
+            continue
+        seen.add(label)
+        buffer.append(label)
+        if len(buffer) >= BATCH:
+            index_batch(es, index_name, ambiguity_c, buffer)
+            buffer = []
+            if len(seen) > 100 * BATCH:
+                seen = set()
+
+    if len(buffer) > 0:
+        index_batch(es, index_name, ambiguity_c, buffer)
+
+    print("All Finished")
+except Exception as e:
+    print(e)
+    traceback.print_exc()
+    print("An error occurred. Exiting...")
+    sys.exit(1)
@@ -0,0 +1,95 @@
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from model.literal_recognizer import LiteralRecognizer, _classify, _classify_uncached
+
+MONTHS = ["january", "march", "august", "december"]
+
+
+def random_cell(rng):
+    kind = rng.randrange(12)
+    if kind == 0:
+        return f"{rng.randint(1000, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    if kind == 1:
+        return f"{rng.randint(1, 28)} {rng.choice(MONTHS)} {rng.randint(1000, 2023)}"
+    if kind == 2:
+        return f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+    if kind == 3:
+        return f"https://www.{random_word(rng)}.com/{random_word(rng)}"
+    if kind == 4:
+        return f"{random_word(rng)}@{random_word(rng)}.org"
+    if kind == 5:
+        return f"{rng.uniform(-1000, 1000):.{rng.randint(1, 4)}f}"
+    if kind == 6:
+        return str(rng.randint(-10 ** 6, 10 ** 6))
+    if kind == 7:
+        return f"{rng.randint(1, 999)} {rng.choice(['km', 'mi', 'million', 'thousand'])}"
+    if kind == 8:
+        return f"{rng.randint(1900, 2000)}-{rng.randint(2000, 2023)}"
+    # names and free text, the most common cells
+    return " ".join(random_word(rng).capitalize() for _ in range(rng.randint(1, 4)))
+
+
+def random_word(rng, max_length=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, max_length)))
+
+
+def check_loop(cells):
+    # the classification previously done by LiteralRecognizer.check_literal, one regex at a time
+    labels = []
+    for cell in cells:
+        label = 'STRING'
+        for key in LiteralRecognizer.literal_types:
+            if len(list(LiteralRecognizer.literal_types[key].finditer(cell))) > 0:
+                label = key.upper()
+                break
+        labels.append(label)
+    return labels
+
+
+def check_automaton(cells):
+    return [_classify_uncached(cell) for cell in cells]
+
+
+def check_bulk(cells):
+    return LiteralRecognizer.check_literals(cells)
+
+
+def bench(function, cells, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(cells)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    # Usage: python benchmark_literal_recognizer.py [cells] [distinct values] [repeat]
+    n_cells = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    rng = random.Random(42)
+    values = [random_cell(rng) for _ in range(n_distinct)]
+    cells = [rng.choice(values) for _ in range(n_cells)]
+
+    time_loop, expected = bench(check_loop, cells, repeat)
+    time_automaton, result_automaton = bench(check_automaton, cells, repeat)
+    _classify.cache_clear()
+    time_bulk, result_bulk = bench(check_bulk, cells, repeat)
+    if result_automaton != expected or result_bulk != expected:
+        sys.exit("Classifications differ")
+
+    print(f"{n_cells} cells, {n_distinct} distinct values (best of {repeat})")
+    print(f"regex loop:          {time_loop * 1000:.2f} ms")
+    print(f"combined automaton:  {time_automaton * 1000:.2f} ms ({time_loop / time_automaton:.1f}x)")
+    print(f"bulk + memo:         {time_bulk * 1000:.2f} ms ({time_loop / time_bulk:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
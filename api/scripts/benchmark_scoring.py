@@ -0,0 +1,68 @@
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from model.utils import MentionScorer, compute_similarity_between_string, editdistance
+
+
+def random_label(rng, max_tokens=4, max_token_length=10):
+    tokens = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(1, max_token_length)))
+        for _ in range(rng.randint(1, max_tokens))
+    ]
+    return " ".join(tokens)
+
+
+def score_loop(mention, labels):
+    # the per-candidate scoring previously done in LookupRetriever
+    return [
+        (
+            round(editdistance(label, mention), 2),
+            round(compute_similarity_between_string(label, mention), 2),
+            round(compute_similarity_between_string(label, mention, 3), 2),
+        )
+        for label in labels
+    ]
+
+
+def score_batch(mention, labels):
+    return MentionScorer(mention).score(labels)
+
+
+def bench(function, mention, labels, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(mention, labels)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    n_candidates = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = random.Random(42)
+    mentions = [random_label(rng, max_tokens=3) for _ in range(20)]
+
+    total_loop, total_batch = 0, 0
+    for mention in mentions:
+        labels = [random_label(rng) for _ in range(n_candidates)]
+        time_loop, expected = bench(score_loop, mention, labels, repeat)
+        time_batch, result = bench(score_batch, mention, labels, repeat)
+        if result != expected:
+            sys.exit(f"Scores differ for mention '{mention}'")
+        total_loop += time_loop
+        total_batch += time_batch
+
+    print(f"{len(mentions)} mentions x {n_candidates} candidates (best of {repeat})")
+    print(f"per-candidate loop: {total_loop / len(mentions) * 1000:.2f} ms/mention")
+    print(f"MentionScorer:      {total_batch / len(mentions) * 1000:.2f} ms/mention")
+    print(f"speedup:            {total_loop / total_batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,12 @@ MAPPING = {
                 "analyzer": "my_analyzer"
             },
             "description": {"type": "text"},
-            "types": {"type": "keyword"},
+            "types": {
+                "type": "keyword",
+                "fields": {
+                    "ids": {"type": "text", "analyzer": "whitespace"}
+                }
+            },
             "length": {"type": "long"},
             "ntoken": {"type": "long"},
             "popularity": {"type": "double"}
@@ -108,7 +108,11 @@ try:
     )
 
     with open("../index_mappings.json") as f:
-        index_mappings = json.loads(f.read())[kg_name]["indexes"]
+        kg_mappings = json.loads(f.read())[kg_name]
+    index_mappings = kg_mappings["indexes"]
+    # P31 types of each category, in priority order: the first category matching an entity wins.
+    # The same table routes typed lookups to these indexes in model/elastic.py
+    types_by_index = [(category, set(types)) for category, types in kg_mappings["types_by_index"].items()]
 
     for cluster in index_mappings:
         index_name = index_mappings[cluster]
@@ -121,52 +125,6 @@ try:
     TOTAL_DOCS = documents_c.estimated_document_count()
     results = documents_c.find({})
 
-    human_set = set({"Q5"})
-    disambiguation_set = set({"Q4167410"})
-    category_set = set({"Q4167836"})
-    species_event_timeinterval_physicalobject_set = set({"Q1656682", "Q186081", "Q223557", "Q7432"})
-    creativework_film_videogame_tvseries_set = set({"Q17537576", "Q7889", "Q229390", "Q261636"})
-    organization_set = set(
-        {
-            "Q43229",
-            "Q891723",
-            "Q18388277",
-            "Q1058914",
-            "Q161726",
-            "Q6881511",
-            "Q4830453",
-            "Q431289",
-            "Q891723",
-            "Q167037",
-            "Q18388277",
-            "Q1055701",
-        }
-    )
-    location_set = set(
-        {
-            "Q2221906",
-            "Q3624078",
-            "Q619610",
-            "Q179164",
-            "Q7270",
-            "Q51576574",
-            "Q185145",
-            "Q113489728",
-            "Q1520223",
-            "Q5255892",
-            "Q512187",
-            "Q99541706",
-            "Q1200957",
-            "Q1637706",
-            "Q5119",
-            "Q208511",
-            "Q174844",
-            "Q51929311",
-            "Q1187811",
-            "Q1549591",
-        }
-    )
-
     buffer = []
     index = 0
     for i, item in enumerate(tqdm(results, total=TOTAL_DOCS)):
@@ -193,22 +151,12 @@ try:
             index_name = index_mappings["predicate"]
         elif category == "type":
             index_name = index_mappings["type"]
-        elif len(type_set.intersection(human_set)) > 0:
-            index_name = index_mappings["human"]
-        elif len(type_set.intersection(disambiguation_set)) > 0:
-            index_name = index_mappings["disambiguation"]
-        elif len(type_set.intersection(category_set)) > 0:
-            index_name = index_mappings["category"]
-        elif len(type_set.intersection(species_event_timeinterval_physicalobject_set)) > 0:
-            index_name = index_mappings["species_event_timeinterval_physicalobject"]
-        elif len(type_set.intersection(creativework_film_videogame_tvseries_set)) > 0:
-            index_name = index_mappings["creativework_film_videogame_tvseries"]
-        elif len(type_set.intersection(organization_set)) > 0:
-            index_name = index_mappings["organization"]
-        elif len(type_set.intersection(location_set)) > 0:
-            index_name = index_mappings["location"]
         else:
             index_name = index_mappings["other"]
+            for cluster, cluster_types in types_by_index:
+                if len(type_set.intersection(cluster_types)) > 0:
+                    index_name = index_mappings[cluster]
+                    break
 
         for j, name in enumerate(names):
             doc = {
@@ -0,0 +1,46 @@
+import os
+import sys
+import traceback
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from model.fake_kg import FAKE_DB_NAME, FAKE_DB_SNAPSHOT, bootstrap_fake_db, write_snapshot
+
+# Creates the fake KG before the API workers start (run it once, e.g. before gunicorn, with
+# FAKE_DB_BOOTSTRAP=off for the workers), restoring FAKE_DB_SNAPSHOT when it exists.
+#
+# Usage: python fake_db_bootstrap.py [--snapshot <PATH>]
+#   --snapshot: writes the fake KG to PATH (gzipped BSON) after creating it, to be used as FAKE_DB_SNAPSHOT
+
+try:
+    snapshot_path = None
+    if len(sys.argv) > 1:
+        if sys.argv[1] != "--snapshot" or len(sys.argv) != 3:
+            raise ValueError(sys.argv[1:])
+        snapshot_path = sys.argv[2]
+except Exception:
+    sys.exit("Usage: python fake_db_bootstrap.py [--snapshot <PATH>]")
+
+try:
+    MONGO_ENDPOINT, MONGO_ENDPOINT_PORT = os.environ["MONGO_ENDPOINT"].split(":")
+    MONGO_ENDPOINT_USERNAME = os.environ["MONGO_INITDB_ROOT_USERNAME"]
+    MONGO_ENDPOINT_PASSWORD = os.environ["MONGO_INITDB_ROOT_PASSWORD"]
+    client = MongoClient(
+        MONGO_ENDPOINT, int(MONGO_ENDPOINT_PORT), username=MONGO_ENDPOINT_USERNAME, password=MONGO_ENDPOINT_PASSWORD
+    )
+
+    if not bootstrap_fake_db(client, snapshot=FAKE_DB_SNAPSHOT):
+        print("Fake database already created (or being created by another process).")
+
+    if snapshot_path is not None:
+        write_snapshot(client[FAKE_DB_NAME], snapshot_path)
+        print(f"Snapshot written to {snapshot_path}")
+
+    print("All Finished")
+except Exception as e:
+    print(e)
+    traceback.print_exc()
+    print("An error occurred. Exiting...")
+    sys.exit(1)
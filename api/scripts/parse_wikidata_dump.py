@@ -2,14 +2,20 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import argparse
 import bz2
 import json
+import multiprocessing
 import os
-import sys
+import shlex
+import shutil
+import subprocess
 import traceback
 from datetime import datetime
+from queue import Full
 
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
 from tqdm import tqdm
 
 
@@ -26,7 +32,7 @@ def create_indexes(db):
 
     for collection, fields in index_specs.items():
         if collection == "cache":
-            db[collection].create_index([("cell", 1), ("fuzzy", 1), ("type", 1), ("kg", 1), ("limit", 1)], unique=True)
+            db[collection].create_index([("cell", 1), ("fuzzy", 1), ("type", 1), ("kg", 1), ("ids", 1)], unique=True)
         elif collection == "items":
             db[collection].create_index([("entity", 1), ("category", 1)], unique=True)
         for field in fields:
@@ -36,41 +42,29 @@ def create_indexes(db):
 # Initial Estimation
 initial_estimated_average_size = 800  # Initial average size in bytes, can be adjusted
 BATCH_SIZE = 100  # Number of entities to insert in a single batch
+# Parallel mode: lines parsed per task, and tasks queued for the parsers and for the writers per process
+CHUNK_LINES = 1000
+QUEUE_SIZE = 4
+# Seconds between two checks that the other stages are still running, while waiting for them
+LIVENESS_INTERVAL = 5
+COLLECTIONS = ("items", "objects", "literals", "types")
 
-if len(sys.argv) < 2:
-    print("Usage: python script_name.py <path_to_wikidata_dump>")
-    sys.exit(1)
-
-file_path = sys.argv[1]  # Get the file path from command line argument
-compressed_file_size = os.path.getsize(file_path)
-initial_total_lines_estimate = compressed_file_size / initial_estimated_average_size
-
-file = bz2.BZ2File(file_path, "r")
-
-# MongoDB connection setup
-MONGO_ENDPOINT, MONGO_ENDPOINT_PORT = os.environ["MONGO_ENDPOINT"].split(":")
-MONGO_ENDPOINT = "localhost"
-MONGO_ENDPOINT_PORT = int(MONGO_ENDPOINT_PORT)
-MONGO_ENDPOINT_USERNAME = os.environ["MONGO_INITDB_ROOT_USERNAME"]
-MONGO_ENDPOINT_PASSWORD = os.environ["MONGO_INITDB_ROOT_PASSWORD"]
 current_date = datetime.now()
 formatted_date = current_date.strftime("%d%m%Y")
 DB_NAME = f"wikidata{formatted_date}"
 
-client = MongoClient(
-    MONGO_ENDPOINT, MONGO_ENDPOINT_PORT, username=MONGO_ENDPOINT_USERNAME, password=MONGO_ENDPOINT_PASSWORD
-)
-log_c = client.wikidata.log
-items_c = client[DB_NAME].items
-objects_c = client[DB_NAME].objects
-literals_c = client[DB_NAME].literals
-types_c = client[DB_NAME].types
 
-c_ref = {"items": items_c, "objects": objects_c, "literals": literals_c, "types": types_c}
+def connect():
+    # MongoDB connection setup
+    MONGO_ENDPOINT, MONGO_ENDPOINT_PORT = os.environ["MONGO_ENDPOINT"].split(":")
+    MONGO_ENDPOINT = "localhost"
+    MONGO_ENDPOINT_PORT = int(MONGO_ENDPOINT_PORT)
+    MONGO_ENDPOINT_USERNAME = os.environ["MONGO_INITDB_ROOT_USERNAME"]
+    MONGO_ENDPOINT_PASSWORD = os.environ["MONGO_INITDB_ROOT_PASSWORD"]
+    return MongoClient(
+        MONGO_ENDPOINT, MONGO_ENDPOINT_PORT, username=MONGO_ENDPOINT_USERNAME, password=MONGO_ENDPOINT_PASSWORD
+    )
 
-create_indexes(client[DB_NAME])
-
-buffer = {"items": [], "objects": [], "literals": [], "types": []}
 
 DATATYPES_MAPPINGS = {
     "external-id": "STRING",
@@ -86,7 +80,7 @@ DATATYPES_MAPPINGS = {
     "musical-notation": "MUSICAL_NOTATION",
     "tabular-data": "TABULAR_DATA",
 }
-DATATYPES = list(set(DATATYPES_MAPPINGS.values()))
+DATATYPES = sorted(set(DATATYPES_MAPPINGS.values()))
 total_size_processed = 0
 num_entities_processed = 0
 
@@ -128,14 +122,20 @@ def get_value(obj, datatype):
     return value
 
 
-def flush_buffer(buffer):
+def flush_buffer(buffer, c_ref):
     for key in buffer:
         if len(buffer[key]) > 0:
             c_ref[key].insert_many(buffer[key])
             buffer[key] = []
 
 
+def decode_line(line):
+    # one entity per line, followed by a comma (but the last one); the "[" and "]" lines do not decode
+    return json.loads(line.rstrip(b",\r\n"))
+
+
 def parse_data(item, i):
+    # the documents of the entity on line i, for every collection
     entity = item["id"]
     labels = item.get("labels", {})
     aliases = item.get("aliases", {})
@@ -209,19 +209,21 @@ def parse_data(item, i):
                     lit[predicate] = []
                 lit[predicate].append(value)
 
-    for key in buffer:
-        buffer[key].append(join[key])
+    return join
 
-    if len(buffer["items"]) == BATCH_SIZE:
-        flush_buffer(buffer)
 
+def parse_wikidata_dump(file_path, client):
+    compressed_file_size = os.path.getsize(file_path)
+    initial_total_lines_estimate = compressed_file_size / initial_estimated_average_size
+    file = bz2.BZ2File(file_path, "r")
+    log_c = client.wikidata.log
+    c_ref = {key: client[DB_NAME][key] for key in COLLECTIONS}
+    buffer = {key: [] for key in COLLECTIONS}
 
-def parse_wikidata_dump():
-    global initial_total_lines_estimate
     pbar = tqdm(total=initial_total_lines_estimate)
     for i, line in enumerate(file):
         try:
-            item = json.loads(line[:-2])  # Remove the trailing characters
+            item = decode_line(line)
             line_size = len(line)
             current_average_size = update_average_size(line_size)
 
@@ -229,7 +231,11 @@ def parse_wikidata_dump():
             pbar.total = round(compressed_file_size / current_average_size)
             pbar.update(1)
 
-            parse_data(item, i)
+            join = parse_data(item, i)
+            for key in buffer:
+                buffer[key].append(join[key])
+            if len(buffer["items"]) == BATCH_SIZE:
+                flush_buffer(buffer, c_ref)
         except json.decoder.JSONDecodeError:
             continue
         except Exception as e:
@@ -237,13 +243,177 @@ def parse_wikidata_dump():
             log_c.insert_one({"entity": item["id"], "error": str(e), "traceback_str": traceback_str})
 
     if len(buffer["items"]) > 0:
-        flush_buffer(buffer)
+        flush_buffer(buffer, c_ref)
 
     pbar.close()
 
 
+# Parallel mode: the dump is decompressed by its own stage (an external, multi-threaded decompressor
+# such as lbzip2 when available, else bz2 in the main process), which only splits it in chunks of
+# lines for the parser processes (json.loads and parse_data). The parsers hand the documents to
+# writer processes doing unordered insert_many. The queues are bounded, so a slow stage slows down
+# the ones before it instead of filling the memory.
+
+
+def open_dump(file_path, decompressor):
+    if decompressor is None:
+        decompressor = next((f"{tool} -dc" for tool in ("lbzip2", "pbzip2") if shutil.which(tool)), "")
+    if decompressor == "":
+        print("Decompressing with bz2 in the main process (install lbzip2 or pbzip2 for a parallel decompression)")
+        return bz2.BZ2File(file_path, "r"), None
+    print(f"Decompressing with {decompressor}")
+    process = subprocess.Popen(shlex.split(decompressor) + [file_path], stdout=subprocess.PIPE, bufsize=1024 * 1024)
+    return process.stdout, process
+
+
+def parse_worker(line_queue, document_queue):
+    while True:
+        task = line_queue.get()
+        if task is None:
+            return
+        start, lines = task
+        documents = {key: [] for key in COLLECTIONS}
+        errors = []
+        for i, line in enumerate(lines, start):
+            try:
+                item = decode_line(line)
+            except json.decoder.JSONDecodeError:
+                continue
+            try:
+                join = parse_data(item, i)
+            except Exception as e:
+                errors.append({"entity": item.get("id"), "error": str(e), "traceback_str": traceback.format_exc()})
+                continue
+            for key in documents:
+                documents[key].append(join[key])
+        for key in COLLECTIONS:
+            if len(documents[key]) > 0:
+                document_queue.put((key, documents[key]))
+        if len(errors) > 0:
+            document_queue.put(("log", errors))
+
+
+def write_worker(document_queue):
+    client = connect()
+    c_ref = {key: client[DB_NAME][key] for key in COLLECTIONS}
+    c_ref["log"] = client.wikidata.log
+    while True:
+        task = document_queue.get()
+        if task is None:
+            return
+        key, documents = task
+        try:
+            c_ref[key].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # e.g. duplicates of a previous (interrupted) run: the other documents are inserted anyway
+            print(f"{key}: {len(e.details.get('writeErrors', []))} documents not inserted", flush=True)
+        except PyMongoError as e:
+            # e.g. a lost connection or a document too large: the batch is lost, the writer goes on
+            print(f"{key}: batch of {len(documents)} documents not inserted: {e!r}", flush=True)
+
+
+def check_stages(processes):
+    # the stage processes only exit on their end marker, an earlier exit is a failure
+    for process in processes:
+        if process.exitcode is not None:
+            raise RuntimeError(f"{process.name} exited with status {process.exitcode}")
+
+
+def put_checked(queue, task, processes):
+    # waits for room in the queue as long as the stage processes are running
+    while True:
+        try:
+            queue.put(task, timeout=LIVENESS_INTERVAL)
+            return
+        except Full:
+            check_stages(processes)
+
+
+def join_checked(stage, processes):
+    # waits for the processes of a stage, as long as the other stage processes are running
+    for process in stage:
+        process.join(timeout=LIVENESS_INTERVAL)
+        while process.is_alive():
+            check_stages(processes)
+            process.join(timeout=LIVENESS_INTERVAL)
+        if process.exitcode != 0:
+            raise RuntimeError(f"{process.name} exited with status {process.exitcode}")
+
+
+def parse_wikidata_dump_parallel(file_path, workers, writers, decompressor=None):
+    compressed_file_size = os.path.getsize(file_path)
+    file, process = open_dump(file_path, decompressor)
+    line_queue = multiprocessing.Queue(maxsize=workers * QUEUE_SIZE)
+    document_queue = multiprocessing.Queue(maxsize=writers * QUEUE_SIZE)
+    parsers = [
+        multiprocessing.Process(target=parse_worker, args=(line_queue, document_queue), name=f"parser-{i}")
+        for i in range(workers)
+    ]
+    writer_processes = [
+        multiprocessing.Process(target=write_worker, args=(document_queue,), name=f"writer-{i}")
+        for i in range(writers)
+    ]
+    stages = parsers + writer_processes
+    for worker in stages:
+        worker.start()
+
+    # a stage that dies stops the import, instead of leaving the others blocked on the full queues
+    try:
+        pbar = tqdm(total=round(compressed_file_size / initial_estimated_average_size))
+        lines = []
+        start = 0
+        for i, line in enumerate(file):
+            lines.append(line)
+            current_average_size = update_average_size(len(line))
+            if len(lines) == CHUNK_LINES:
+                put_checked(line_queue, (start, lines), stages)
+                pbar.total = round(compressed_file_size / current_average_size)
+                pbar.update(len(lines))
+                lines = []
+                start = i + 1
+        if len(lines) > 0:
+            put_checked(line_queue, (start, lines), stages)
+            pbar.update(len(lines))
+
+        for _ in parsers:
+            put_checked(line_queue, None, stages)
+        join_checked(parsers, writer_processes)
+        for _ in writer_processes:
+            put_checked(document_queue, None, writer_processes)
+        join_checked(writer_processes, [])
+        pbar.close()
+    except BaseException:
+        for worker in stages:
+            if worker.is_alive():
+                worker.terminate()
+        if process is not None:
+            process.kill()
+        # the tasks still buffered for the dead stages are dropped, so that the exit does not wait on them
+        line_queue.cancel_join_thread()
+        document_queue.cancel_join_thread()
+        raise
+    if process is not None and process.wait() != 0:
+        raise RuntimeError(f"The decompressor exited with status {process.returncode}")
+
+
 def main():
-    parse_wikidata_dump()
+    parser = argparse.ArgumentParser(description="Imports a Wikidata JSON dump (bz2) into MongoDB.")
+    parser.add_argument("dump", help="path to the Wikidata dump")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="parser processes of the parallel mode (default 0: single process)")
+    parser.add_argument("--writers", type=int, default=2, help="writer processes of the parallel mode")
+    parser.add_argument("--decompressor", default=None,
+                        help='decompression command of the parallel mode, e.g. "lbzip2 -dc" ("" for bz2 in the '
+                             "main process, default: lbzip2 or pbzip2 when installed)")
+    args = parser.parse_args()
+
+    client = connect()
+    create_indexes(client[DB_NAME])
+
+    if args.workers > 0:
+        parse_wikidata_dump_parallel(args.dump, args.workers, max(args.writers, 1), args.decompressor)
+    else:
+        parse_wikidata_dump(args.dump, client)
     final_average_size = total_size_processed / num_entities_processed
     print(f"Final average size of an entity: {final_average_size} bytes")
     # Optionally store this value for future use
@@ -1,9 +1,12 @@
+import csv
 import json
+import os
+import threading
 import traceback
 import logging
 from flask import Flask, request
 from flask_restx import Api, Resource, fields, reqparse
-from model.data_retrievers.column_analysis import ColumnAnalysis
+from model.data_retrievers.column_analysis import COLUMN_SAMPLING_ENABLED, ColumnAnalysis, read_table_rows
 from model.data_retrievers.labels_retriever import LabelsRetriever
 from model.data_retrievers.literal_classifier import LiteralClassifier
 from model.data_retrievers.literals_retriever import LiteralsRetriever
@@ -14,9 +17,21 @@ from model.data_retrievers.predicates_retriever import PredicatesRetriever
 from model.data_retrievers.types_retriever import TypesRetriever
 from model.data_retrievers.sameas_retriever import SameasRetriever
 from model.data_retrievers.summary_retriever import SummaryRetriever
+from model.data_retrievers.table_interpreter import TableInterpreter
 from model.params_validator import ParamsValidator
 from model.utils import build_error
 from model.database import Database
+from model.candidate_cache import CANDIDATE_CACHE_ENABLED
+from model.column_cache import COLUMN_CACHE_ENABLED, ColumnCache
+from model.type_labels import TYPE_LABEL_REGISTRY_ENABLED, TypeLabelRegistry
+from model.nlp import model_registry, nlp_pool
+from model.cpu_executor import cpu_executor
+
+# The heavy services (database mappings and fake KG, spaCy, Elasticsearch) are initialized on first use;
+# the warm-up initializes them in the background right after the worker starts
+WARM_UP = os.environ.get("WARM_UP", "true").lower() == "true"
+# Set when gunicorn preloads the app in the master (see gunicorn.conf.py)
+GUNICORN_PRELOAD = os.environ.get("GUNICORN_PRELOAD", "false").lower() == "true"
 
 
 database = Database()
@@ -27,17 +42,52 @@ with open("query_templates.json") as f:
 
 # instance objects
 params_validator = ParamsValidator()
-type_retriever = TypesRetriever(database)
+type_label_registry = TypeLabelRegistry(database) if TYPE_LABEL_REGISTRY_ENABLED else None
+type_retriever = TypesRetriever(database, type_label_registry)
 objects_retriever = ObjectsRetriever(database)
 predicates_retriever = PredicatesRetriever(database)
 labels_retriever = LabelsRetriever(database)
 literal_classifier = LiteralClassifier()
 literals_retriever = LiteralsRetriever(database)
 sameas_retriever = SameasRetriever(database)
-column_analysis_classifier = ColumnAnalysis()
-lookup_retriever = LookupRetriever(database)
+column_cache = ColumnCache(database) if COLUMN_CACHE_ENABLED else None
+column_analysis_classifier = ColumnAnalysis(column_cache)
+lookup_retriever = LookupRetriever(database, use_candidate_cache=CANDIDATE_CACHE_ENABLED,
+                                   type_label_registry=type_label_registry)
 ner_recognition = NERRecognizer()
 summary_retriever = SummaryRetriever(database)
+table_interpreter = TableInterpreter(column_analysis_classifier, lookup_retriever, type_retriever, objects_retriever)
+
+
+def warm_up():
+    services = [
+        ("database", database.ensure_initialized),
+        ("nlp", nlp_pool.warm_up),
+        ("cpu_pool", cpu_executor.warm_up),
+        ("elasticsearch", lookup_retriever.elastic_retriever.is_ready),
+    ]
+    if type_label_registry is not None:
+        # starts loading the tables of every active database
+        services.append(("type_labels", type_label_registry.is_ready))
+    for name, start in services:
+        try:
+            start()
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}", flush=True)
+
+
+def start_warm_up():
+    if WARM_UP:
+        threading.Thread(target=warm_up, daemon=True).start()
+
+
+if GUNICORN_PRELOAD:
+    # the models are loaded before the workers are forked (unless the inference runs in the NLP pool),
+    # the clients (not fork-safe) are warmed up in each worker by the post_worker_init hook
+    if nlp_pool.size <= 0:
+        model_registry.preload()
+else:
+    start_warm_up()
 
 def init_services():
     with open('data.txt') as f:
@@ -134,6 +184,13 @@ fields_ner = info.model('NERRecognizer', {
     ])
 })
 
+fields_lookup_batch = info.model('LookupBatch', {
+    'json': fields.List(fields.Raw, example=[
+        {"name": "Batman Begins", "limit": 10, "fuzzy": False, "types": "Q11424", "ids": None},
+        {"name": "Christopher Nolan", "limit": 10, "fuzzy": False}
+    ])
+})
+
 fields_cells = api.model("Cells",  {
     "cells": fields.List(fields.String(), required=True, example=["Rome", "Paris", "Praga"])
 })
@@ -161,6 +218,59 @@ class Info(Resource):
         return info_obj, 200
 
 
+@info.route('/metrics')
+@api.doc(
+    responses={200: "OK"},
+    description='Runtime metrics of the lookup pipeline (per-stage timings, candidate cache hits and misses, lookups cut by the fallback budget) and of the CPU executors (queue depth, wait times).'
+)
+class Metrics(Resource):
+    def get(self):
+        metrics = {
+            "lookup": lookup_retriever.get_stats(),
+            "executors": {"cpu": cpu_executor.get_stats(), "nlp": nlp_pool.get_stats()},
+        }
+        if column_cache is not None:
+            metrics["column_cache"] = column_cache.get_stats()
+        return metrics, 200
+
+
+@info.route('/ready')
+@api.doc(
+    responses={200: "OK", 503: "Not ready"},
+    description='Readiness of each subsystem: services are initialized on first use or by the warm-up.'
+)
+class Ready(Resource):
+    def get(self):
+        subsystems = {
+            "database": database.is_ready(),
+            "nlp": nlp_pool.is_ready(),
+            "elasticsearch": lookup_retriever.elastic_retriever.is_ready(),
+        }
+        if type_label_registry is not None:
+            subsystems["type_labels"] = database.is_ready() and type_label_registry.is_ready()
+        ready = all(subsystems.values())
+        return {"ready": ready, "subsystems": subsystems}, 200 if ready else 503
+
+
+@info.route('/mappings/refresh')
+@api.doc(
+    responses={200: "OK", 403: "Invalid token"},
+    params={"token": "Private token to access the API."},
+    description='Reloads the Knowledge Graph -> database mappings, e.g. right after a new dump has been loaded. The other workers follow within MAPPINGS_SIGNAL_INTERVAL seconds.'
+)
+class MappingsRefresh(Resource):
+    def post(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('token', type=str, location="args")
+        args = parser.parse_args()
+
+        token_is_valid, token_error = params_validator.validate_token(args["token"])
+        if not token_is_valid:
+            return token_error
+
+        return {"mappings": database.update_mappings()}, 200
+
+
 class BaseEndpoint(Resource):
 
     def validate_and_get_json_format(self):
@@ -240,9 +350,54 @@ class Lookup(BaseEndpoint):
         return results
 
 
+@lookup.route('/entity-retrieval-batch')
+@api.doc(
+    responses={200: "OK", 404: "Not found",
+               400: "Bad request", 403: "Invalid token"},
+    params={
+        "token": "Private token to access the API.",
+        "kg": "The Knowledge Graph to query. Available values: <code>wikidata</code>."
+    },
+    description="Given a JSON array of cells (<code>name</code>, <code>limit</code>, <code>fuzzy</code>, <code>types</code>, <code>ids</code>), the endpoint performs the entity-retrieval of every cell with as few Elasticsearch round-trips as possible. Results are keyed by the normalized cell name, so a name repeated with different parameters is rejected."
+)
+class LookupBatch(BaseEndpoint):
+    @lookup.doc(body=fields_lookup_batch)
+    def post(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('token', type=str, location="args")
+        parser.add_argument('kg', type=str, location="args")
+        args = parser.parse_args()
+
+        token = args["token"]
+        kg = args["kg"]
+
+        token_is_valid, token_error = params_validator.validate_token(token)
+        if not token_is_valid:
+            return token_error
+
+        kg_is_valid, kg_error_or_value = params_validator.validate_kg(database, kg)
+        if not kg_is_valid:
+            return kg_error_or_value
+
+        is_data_valid, data = super().validate_and_get_json_format()
+        if not is_data_valid:
+            return data
+
+        cells_are_valid, cells_error_or_value = params_validator.validate_lookup_cells(data)
+        if not cells_are_valid:
+            return cells_error_or_value
+
+        try:
+            results = lookup_retriever.search_batch(cells_error_or_value, kg=kg_error_or_value)
+        except Exception as e:
+            return build_error(f"Elastic error: {str(e)}", 400, traceback=traceback.format_exc())
+
+        return results
+
+
 @entity.route('/types')
 @api.doc(
-    description='Given a JSON array as input composed of DBPedia or Wikidata entities, the endpoint returns the associated TYPES for each entity.',
+    description='Given a JSON array as input composed of DBPedia or Wikidata entities, the endpoint returns the associated TYPES for each entity. Once the type label registry is loaded, the English labels of the types are returned too.',
     params={"token": "Private token to access the APIs.",
             "kg": "The Knowledge Graph to query. Available values: <code>dbpedia</code> or <code>wikidata</code>. Default is <code>dbpedia</code>."}
 )
@@ -500,7 +655,10 @@ class Literals(BaseEndpoint):
 @sti.route('/column-analysis')
 @api.doc(
     description='Given a JSON array as input composed of a set of array of strings (cell content), the endpoint calculates, for each array, if the content represents named-entitites or literals.',
-    params={"token": "Private token to access the APIs."}
+    params={
+        "token": "Private token to access the APIs.",
+        "sample": "Set this param to False to classify every row of the long columns instead of a stratified sample. Default is <code>True</code>."
+    }
 )
 class ColumnAnalysis(BaseEndpoint):
     @api.doc(body=fields_column_analysis)
@@ -508,6 +666,7 @@ class ColumnAnalysis(BaseEndpoint):
         # get parameters
         parser = reqparse.RequestParser()
         parser.add_argument('token', type=str)
+        parser.add_argument('sample', type=str, location="args")
         args = parser.parse_args()
 
         token = args["token"]
@@ -517,13 +676,137 @@ class ColumnAnalysis(BaseEndpoint):
         if not token_is_valid:
             return token_error
         else:
+            sample = COLUMN_SAMPLING_ENABLED
+            if args["sample"] is not None:
+                is_sample_valid, sample = params_validator.validate_bool(args["sample"])
+                if not is_sample_valid:
+                    return sample
             is_data_valid, data = super().validate_and_get_json_format()
             if is_data_valid:
-                return column_analysis_classifier.classifiy_columns(columns=data)
+                return column_analysis_classifier.classifiy_columns(columns=data, sample=sample)
             else:
                 build_error("Invalid Data", 400)
 
 
+@sti.route('/column-analysis/stream')
+@api.doc(
+    description='Column analysis of a table uploaded as the raw request body, in CSV or NDJSON (one JSON array of cells per line). The rows are classified while they are read, so the memory does not grow with the table: the endpoint returns the classification of every column, without its rows unless <code>rows</code> is True.',
+    params={
+        "token": "Private token to access the APIs.",
+        "format": "<code>csv</code> or <code>ndjson</code>. Default is taken from the Content-Type (CSV unless it contains ndjson or json).",
+        "header": "Set this param to True if the first CSV row holds the column names. Default is <code>False</code>.",
+        "rows": "Set this param to True to also return the rows of every column. Default is <code>False</code>."
+    }
+)
+class ColumnAnalysisStream(BaseEndpoint):
+    def post(self):
+        # every parameter is in the query string: the body is only read as a stream
+        parser = reqparse.RequestParser()
+        parser.add_argument('token', type=str, location="args")
+        parser.add_argument('format', type=str, location="args")
+        parser.add_argument('header', type=str, location="args")
+        parser.add_argument('rows', type=str, location="args")
+        args = parser.parse_args()
+
+        token_is_valid, token_error = params_validator.validate_token(args["token"])
+        if not token_is_valid:
+            return token_error
+
+        is_header_valid, header = params_validator.validate_bool(args["header"])
+        if not is_header_valid:
+            return header
+        is_rows_valid, keep_rows = params_validator.validate_bool(args["rows"])
+        if not is_rows_valid:
+            return keep_rows
+
+        table_format = args["format"]
+        if table_format is None:
+            table_format = "ndjson" if "json" in (request.content_type or "") else "csv"
+        table_format = table_format.lower()
+        if table_format not in ("csv", "ndjson"):
+            return build_error("Format must be csv or ndjson", 400)
+
+        try:
+            rows = read_table_rows(request.stream, table_format)
+            columns = next(rows) if header else None
+            result = column_analysis_classifier.classify_stream(rows, keep_rows=keep_rows, header=columns)
+        except StopIteration:
+            return build_error("Empty table", 400)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return build_error(f"Invalid {table_format} data: {e}", 400)
+        if len(result) == 0:
+            return build_error("Empty table", 400)
+        return result
+
+
+@sti.route('/table-interpretation')
+@api.doc(
+    responses={200: "OK", 400: "Bad request", 403: "Invalid token"},
+    description='Given a table as a JSON array of columns (arrays of cells), the endpoint runs the column analysis, the entity-retrieval of the distinct cells of the NE columns, and fetches the types and objects of the top candidates of every cell. It returns the columns classification, the candidates of every cell (keyed by the normalized cell), the types of the top candidates, and for every pair of NE columns the predicates linking the top candidates of the same row, with the number of rows.',
+    params={
+        "token": "Private token to access the APIs.",
+        "kg": "The Knowledge Graph to query. Available values: <code>wikidata</code>.",
+        "limit": "The number of candidates to be retrieved for every cell. The default value is 10.",
+        "k": "The number of top candidates of every cell whose types and objects are fetched. The default value is 3.",
+        "fuzzy": "Set this param to True if fuzzy search must be applied. Default is <code>False</code>.",
+        "sample": "Set this param to False to classify every row of the long columns instead of a stratified sample. Default is <code>True</code>.",
+        "objects": "Set this param to True to also return the objects of the top candidates. Default is <code>False</code>."
+    }
+)
+class TableInterpretation(BaseEndpoint):
+    @api.doc(body=fields_column_analysis)
+    def post(self):
+        parser = reqparse.RequestParser()
+        for name in ("token", "kg", "limit", "k", "fuzzy", "sample", "objects"):
+            parser.add_argument(name, type=str, location="args")
+        args = parser.parse_args()
+
+        token_is_valid, token_error = params_validator.validate_token(args["token"])
+        if not token_is_valid:
+            return token_error
+
+        kg_is_valid, kg_error_or_value = params_validator.validate_kg(database, args["kg"])
+        if not kg_is_valid:
+            return kg_error_or_value
+
+        limit = args["limit"] if args["limit"] is not None else "10"
+        limit_is_valid, limit_error_or_value = params_validator.validate_limit(limit)
+        if not limit_is_valid:
+            return limit_error_or_value
+
+        k = args["k"] if args["k"] is not None else "3"
+        k_is_valid, k_error = params_validator.validate_k(k)
+        if not k_is_valid:
+            return k_error
+
+        is_fuzzy_valid, fuzzy = params_validator.validate_bool(args["fuzzy"])
+        if not is_fuzzy_valid:
+            return fuzzy
+        is_objects_valid, return_objects = params_validator.validate_bool(args["objects"])
+        if not is_objects_valid:
+            return return_objects
+        sample = COLUMN_SAMPLING_ENABLED
+        if args["sample"] is not None:
+            is_sample_valid, sample = params_validator.validate_bool(args["sample"])
+            if not is_sample_valid:
+                return sample
+
+        is_data_valid, data = super().validate_and_get_json_format()
+        if not is_data_valid:
+            return data
+        if not isinstance(data, list) or len(data) == 0 or not all(isinstance(column, list) for column in data):
+            return build_error("The table must be a non-empty list of columns", 400)
+        data = [[cell if isinstance(cell, str) else ("" if cell is None else str(cell)) for cell in column] for column in data]
+
+        try:
+            return table_interpreter.interpret(
+                data, kg=kg_error_or_value, limit=limit_error_or_value, top_k=int(k),
+                fuzzy=fuzzy, sample=sample, return_objects=return_objects
+            )
+        except Exception as e:
+            return build_error(f"Table interpretation error: {str(e)}", 400, traceback=traceback.format_exc())
+
+
 @classify.route('/name-entity-recognition')
 @api.doc(
     description='Given a JSON array as input composed of a set of array of natural language, the endpoint performs the task of Name Entity Recogition and returns the list of mentions found i the text.',
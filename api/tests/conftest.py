@@ -0,0 +1,16 @@
+import os
+import sys
+
+# the modules read their configuration from the environment when they are imported
+os.environ.setdefault("LAMAPI_TOKEN", "test")
+os.environ.setdefault("MONGO_ENDPOINT", "localhost:27017")
+os.environ.setdefault("MONGO_INITDB_ROOT_USERNAME", "test")
+os.environ.setdefault("MONGO_INITDB_ROOT_PASSWORD", "test")
+os.environ.setdefault("SUPPORTED_KGS", "WIKIDATA")
+os.environ.setdefault("ELASTICSEARCH_USERNAME", "test")
+os.environ.setdefault("ELASTIC_ENDPOINT", "localhost:9200")
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, API_DIR)
+# the services open their JSON configuration files relative to the api directory
+os.chdir(API_DIR)
@@ -0,0 +1,155 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from model.candidate_cache import KEY_INDEX, CandidateCache, remove_duplicates, truncate_candidates
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.mongo = mongomock.MongoClient()
+
+    def get_requested_collection(self, collection, kg="wikidata"):
+        return self.mongo["wikidata"][collection]
+
+
+def entry(cell, limit, **fields):
+    document = {"cell": cell, "type": None, "kg": "wikidata", "fuzzy": False, "limit": limit, "candidates": []}
+    document.update(fields)
+    return document
+
+
+def lookup(cell, limit, ids=None):
+    return {"cell": cell, "type": None, "kg": "wikidata", "fuzzy": False, "ids": ids, "limit": limit}
+
+
+def hit(entity_id, es_score, tier="exact"):
+    return {"id": entity_id, "es_score": es_score, "tier": tier}
+
+
+def candidate(entity_id, pos_score, es_score):
+    return {"id": entity_id, "pos_score": pos_score, "es_score": es_score}
+
+
+def test_duplicate_limits_keep_the_largest_entry():
+    database = FakeDatabase()
+    collection = database.get_requested_collection("cache")
+    # entries of the cache keyed by limit
+    collection.create_index([("cell", 1), ("fuzzy", 1), ("type", 1), ("kg", 1), ("limit", 1)], unique=True)
+    collection.insert_many([
+        entry("rome", 10), entry("rome", 100), entry("rome", 50),
+        entry("paris", 5), entry("paris", 20),
+        entry("berlin", 10),
+    ])
+
+    CandidateCache(database).get_collection("wikidata")
+
+    limits = {document["cell"]: document["limit"] for document in collection.find()}
+    assert limits == {"rome": 100, "paris": 20, "berlin": 10}
+    assert collection.count_documents({}) == 3
+    assert "cell_1_fuzzy_1_type_1_kg_1_limit_1" not in collection.index_information()
+
+
+def test_remove_duplicates_counts_missing_key_fields_as_null():
+    collection = FakeDatabase().get_requested_collection("cache")
+    collection.insert_many([entry("rome", 10), entry("rome", 30, ids=None), entry("rome", 20, ids="Q220")])
+
+    assert remove_duplicates(collection) == 1
+    assert sorted(document["limit"] for document in collection.find()) == [20, 30]
+    collection.create_index(KEY_INDEX, unique=True)
+
+
+def test_index_already_dropped_by_another_worker(monkeypatch):
+    database = FakeDatabase()
+    collection = database.get_requested_collection("cache")
+    collection.create_index([("cell", 1), ("fuzzy", 1), ("type", 1), ("kg", 1), ("limit", 1)], unique=True)
+    index_information = collection.index_information()
+    # another worker drops the index between index_information and drop_index
+    collection.drop_index("cell_1_fuzzy_1_type_1_kg_1_limit_1")
+    monkeypatch.setattr(collection, "index_information", lambda: index_information)
+
+    CandidateCache(database).get_collection("wikidata")
+
+    monkeypatch.undo()
+    assert "cell_1_fuzzy_1_type_1_kg_1_ids_1" in collection.index_information()
+
+
+def test_larger_entry_serves_smaller_limits():
+    cache = CandidateCache(FakeDatabase())
+    large = lookup("rome", 4)
+    # hits sorted by popularity, es_score normalized by the best score of the 4 hits
+    large["hits"] = [hit("Q220", 0.5), hit("Q1", 0.4), hit("Q2", 1.0), hit("Q3", 0.2)]
+    large["candidate_hits"] = [0, 1, 2, 3]
+    candidates = [
+        candidate("Q220", 0.25, 0.5), candidate("Q1", 0.5, 0.4), candidate("Q2", 0.75, 1.0), candidate("Q3", 1.0, 0.2)
+    ]
+    cache.put(large, candidates)
+
+    truncated = cache.get(lookup("rome", 2))
+
+    assert [c["id"] for c in truncated] == ["Q220", "Q1"]
+    # pos_score and es_score as computed over the first 2 hits only
+    assert [c["pos_score"] for c in truncated] == [0.5, 1.0]
+    assert [c["es_score"] for c in truncated] == [1.0, 0.8]
+    assert cache.get(lookup("rome", 8)) is None
+    assert cache.get(lookup("rome", 2, ids="Q220")) is None
+
+
+def test_smaller_entry_is_upgraded_in_place():
+    database = FakeDatabase()
+    cache = CandidateCache(database)
+    cache.put(lookup("rome", 2), [candidate("Q220", 1.0, 1.0)])
+    cache.put(lookup("rome", 10), [candidate("Q220", 0.5, 1.0), candidate("Q1", 1.0, 0.5)])
+    cache.put(lookup("rome", 5), [candidate("Q220", 1.0, 1.0)])
+
+    documents = list(database.get_requested_collection("cache").find())
+    assert [document["limit"] for document in documents] == [10]
+    assert cache.stats["upgrades"] == 1 and cache.stats["duplicates"] == 1
+
+
+def test_truncation_keeps_the_candidates_not_cut_by_the_limit():
+    document = {
+        "cell": "rome",
+        "limit": 3,
+        "candidates": [candidate("Q220", 1 / 3, 1.0), candidate("Q1", 2 / 3, 0.5), candidate("Q9", 1.0, 1.0)],
+        # Q9 comes from the ids query, which does not depend on the limit
+        "hit_positions": [0, 1, None],
+        "first_positions": [0, 1, None],
+        "hit_scores": [1.0, 0.5, 0.2],
+    }
+
+    assert [c["id"] for c in truncate_candidates(document, 1)] == ["Q220", "Q9"]
+    assert truncate_candidates(document, 3) == document["candidates"]
+    # entries without hit positions are cut
+    assert [c["id"] for c in truncate_candidates(dict(document, hit_positions=None), 1)] == ["Q220"]
+
+
+def test_truncation_uses_the_exact_hit_positions():
+    cache = CandidateCache(FakeDatabase())
+    large = lookup("rome", 3000)
+    large["hits"] = [hit(f"Q{i}", round(1 - i / 3000, 3)) for i in range(3000)]
+    large["candidate_hits"] = list(range(3000))
+    candidates = [candidate(f"Q{i}", round((i + 1) / 3000, 3), round(1 - i / 3000, 3)) for i in range(3000)]
+    cache.put(large, candidates)
+
+    truncated = cache.get(lookup("rome", 2000))
+
+    # pos_score rounded to 3 digits does not tell hits 1333 and 1334 of 3000 apart
+    assert [c["pos_score"] for c in truncated] == [round((i + 1) / 2000, 3) for i in range(2000)]
+
+
+def test_candidates_built_from_a_later_duplicate_hit():
+    cache = CandidateCache(FakeDatabase())
+    large = lookup("rome", 4)
+    # the second hit of Q220 scored better than the first one and was kept
+    large["hits"] = [hit("Q220", 1.0), hit("Q1", 0.8), hit("Q220", 0.6), hit("Q2", 0.4)]
+    large["candidate_hits"] = [2, 1, 3]
+    cache.put(large, [candidate("Q220", 0.75, 0.6), candidate("Q1", 0.5, 0.8), candidate("Q2", 1.0, 0.4)])
+
+    truncated = cache.get(lookup("rome", 3))
+
+    assert [(c["id"], c["pos_score"], c["es_score"]) for c in truncated] == [("Q220", 1.0, 0.6), ("Q1", 0.667, 0.8)]
+    # with fewer hits Q220 would be built from its first hit, which the entry does not hold
+    assert cache.get(lookup("rome", 2)) is None
+    assert cache.get(lookup("rome", 1)) is None
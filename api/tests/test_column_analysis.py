@@ -0,0 +1,109 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("spacy")
+
+from model.cpu_executor import cpu_executor
+from model.data_retrievers import column_analysis
+from model.data_retrievers.column_analysis import ColumnAnalysis, read_table_rows
+
+
+def capitalized_entities(texts):
+    # stands in for spaCy: every capitalized cell of the concatenated column is a PERSON
+    return [[(cell, "PERSON", 0, 0) for cell in text.split(" ; ") if cell[:1].isupper()] for text in texts]
+
+
+@pytest.fixture
+def analysis(monkeypatch):
+    monkeypatch.setattr(column_analysis, "extract_entities", capitalized_entities)
+    monkeypatch.setattr(cpu_executor, "size", 0)
+    return ColumnAnalysis()
+
+
+def decisions(result):
+    return [(column["tag"], column["classification"], column["datatype"]) for column in result.values()]
+
+
+def synthetic_columns(rows):
+    return [
+        [str((i * 7919) % 100003) for i in range(rows)],
+        [f"{i % 28 + 1}/{i % 12 + 1}/{1900 + i % 120}" for i in range(rows)],
+        [["Alice Smith", "Bob Jones", "Carl Marx", "Dan Brown"][i % 4] for i in range(rows)],
+        [["Alice Smith", "some thing", "12.5 km", "x"][(i * 13) % 4] for i in range(rows)],
+        [f"https://www.site{i}.com/" for i in range(rows)],
+    ]
+
+
+def test_sampling_reproduces_the_exhaustive_decisions(analysis):
+    columns = synthetic_columns(20000)
+
+    exhaustive = analysis.classifiy_columns(columns, sample=False)
+    sampled = analysis.classifiy_columns(columns, sample=True)
+
+    assert decisions(sampled) == decisions(exhaustive)
+    assert all(column["sample_size"] == 20000 for column in exhaustive.values())
+    # the clear-cut columns stop at the first samples
+    assert all(column["sample_size"] < 20000 for column in sampled.values())
+
+
+def test_near_threshold_column_grows_to_the_full_table(analysis):
+    # 41% of entity cells, next to the 40% share separating NE from LIT columns
+    column = ["Alice Smith" if i % 100 < 41 else "lower case text" for i in range(5000)]
+
+    exhaustive = analysis.classifiy_columns([column], sample=False)
+    sampled = analysis.classifiy_columns([column], sample=True)
+
+    assert decisions(sampled) == decisions(exhaustive) == [("NE", "PERSON", None)]
+    assert sampled[0]["sample_size"] == 5000
+
+
+def test_short_tables_are_not_sampled(analysis):
+    columns = synthetic_columns(500)
+
+    result = analysis.classifiy_columns(columns, sample=True)
+
+    assert all(column["sample_size"] == 500 for column in result.values())
+
+
+def test_stratified_order_is_a_permutation_covering_every_block(analysis):
+    order = list(analysis._stratified_order(1003, 10))
+
+    assert sorted(order) == list(range(1003))
+    # every prefix of a multiple of the strata has as many rows of every block
+    first_round = order[:10]
+    assert sorted(row * 10 // 1003 for row in first_round) == list(range(10))
+
+
+def test_ragged_csv_rows(analysis):
+    body = "name,n,date\nAlice Smith,1,12/11/1997\nBob Jones,2\n\nCarl Marx,3,01/02/2001,extra\n"
+
+    rows = read_table_rows(io.BytesIO(body.encode("utf-8")), "csv")
+    header = next(rows)
+    result = analysis.classify_stream(rows, chunk_size=2, keep_rows=True, header=header)
+
+    assert [result[index]["column_name"] for index in result] == ["name", "n", "date", None]
+    assert [result[index]["column_rows"] for index in result] == [
+        ["Alice Smith", "Bob Jones", "Carl Marx"], ["1", "2", "3"], ["12/11/1997", "01/02/2001"], ["extra"]
+    ]
+    assert [result[index]["sample_size"] for index in result] == [3, 3, 2, 1]
+    assert result[0]["tag"] == "NE"
+
+
+def test_ragged_ndjson_rows(analysis):
+    lines = [["Alice Smith", 1, None], ["Bob Jones"], {"name": "Carl Marx", "n": 3}, [], ""]
+    body = "\n".join(json.dumps(line) if line != "" else "" for line in lines) + "\n"
+
+    rows = list(read_table_rows(io.BytesIO(body.encode("utf-8")), "ndjson"))
+
+    assert rows == [["Alice Smith", "1", ""], ["Bob Jones"], ["Carl Marx", "3"], []]
+    result = analysis.classify_stream(iter(rows), chunk_size=10, keep_rows=True)
+    assert [result[index]["column_rows"] for index in result] == [
+        ["Alice Smith", "Bob Jones", "Carl Marx"], ["1", "3"], [""]
+    ]
+
+
+def test_ndjson_rows_must_be_arrays():
+    with pytest.raises(ValueError):
+        list(read_table_rows(io.BytesIO(b'"Alice Smith"\n'), "ndjson"))
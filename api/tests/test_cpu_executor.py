@@ -0,0 +1,117 @@
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from model.cpu_executor import CpuExecutor
+from model.utils import score_mentions
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# concurrent offloads from greenlets of a monkey-patched process, while another greenlet ticks
+GEVENT_SCRIPT = """
+from gevent import monkey
+monkey.patch_all()
+
+import sys
+import time
+
+import gevent
+
+sys.path.insert(0, {api_dir!r})
+
+from model.cpu_executor import CpuExecutor
+from model.utils import score_mentions
+
+
+def main():
+    executor = CpuExecutor("cpu", size=2, min_items=0)
+    labels = ["label number %d of the city" % i for i in range({labels})]
+    ticks = []
+
+    def tick():
+        while True:
+            ticks.append(time.time())
+            gevent.sleep(0.05)
+
+    ticker = gevent.spawn(tick)
+    calls = [gevent.spawn(executor.run, score_mentions, [("city", labels)]) for _ in range({calls})]
+    done = gevent.joinall(calls, timeout=30)
+    ticker.kill()
+    # the longest pause of the hub while the calls ran
+    pause = max(b - a for a, b in zip(ticks, ticks[1:]))
+    print(sum(1 for call in done if call.successful()), len(calls[0].value[0]), round(pause, 3), flush=True)
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
+"""
+
+
+def fail(value):
+    raise ValueError(f"bad {value}")
+
+
+def exit_process():
+    os._exit(3)
+
+
+@pytest.fixture
+def executor():
+    executor = CpuExecutor("test", size=2, min_items=0)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("labels, calls", [(20000, 3), (3000, 6)])
+def test_concurrent_offloads_under_gevent_keep_the_hub_running(tmp_path, labels, calls):
+    pytest.importorskip("gevent")
+    script = tmp_path / "offload.py"
+    script.write_text(GEVENT_SCRIPT.format(api_dir=API_DIR, labels=labels, calls=calls))
+
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120, cwd=API_DIR)
+
+    assert result.returncode == 0, result.stderr
+    done, scores, pause = result.stdout.split()
+    assert int(done) == calls and int(scores) == labels
+    # the other greenlets keep running, the pauses do not last the whole computation
+    assert float(pause) < 1
+
+
+def test_concurrent_offloads_from_threads(executor):
+    labels = [f"label number {i} of the city" for i in range(3000)]
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(executor.run(score_mentions, [("city", labels)])))
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+
+    assert len(results) == 6 and all(len(result[0]) == 3000 for result in results)
+    assert executor.get_stats()["pending"] == 0
+
+
+def test_map_keeps_the_order(executor):
+    assert executor.map(pow, [(2, i) for i in range(10)]) == [2 ** i for i in range(10)]
+
+
+def test_errors_are_raised_in_the_caller(executor):
+    with pytest.raises(ValueError, match="bad 1"):
+        executor.map(fail, [(1,), (2,)])
+
+    assert executor.get_stats()["failed"] == 1
+    assert executor.run(pow, 3, 2) == 9
+
+
+def test_dead_processes_are_replaced(executor):
+    with pytest.raises(BrokenProcessPool):
+        executor.run(exit_process)
+
+    assert executor.map(pow, [(3, 2)] * 3) == [9, 9, 9]
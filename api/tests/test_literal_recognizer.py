@@ -0,0 +1,61 @@
+import random
+import string
+
+from model.literal_recognizer import LiteralRecognizer, _classify_uncached
+
+MONTHS = ["january", "march", "august", "dicember"]
+UNITS = ["km", "km2", "mi", "ft", "million", "thousand"]
+
+
+def classify_with_loop(cell):
+    # the classification before the combined automaton: one regex at a time, in priority order
+    for key, pattern in LiteralRecognizer.literal_types.items():
+        if len(list(pattern.finditer(cell))) > 0:
+            return key.upper()
+    return "STRING"
+
+
+def random_word(rng, max_length=8):
+    return "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(1, max_length)))
+
+
+def random_cell(rng):
+    kind = rng.randrange(14)
+    if kind == 0:
+        return f"{rng.randint(1000, 2023)}{rng.choice('-./')}{rng.randint(1, 12)}{rng.choice('-./')}{rng.randint(1, 28)}"
+    if kind == 1:
+        return f"{rng.randint(1, 28)}{rng.choice([' ', ',', '.'])}{rng.choice(MONTHS)} {rng.randint(1000, 2023)}"
+    if kind == 2:
+        return f"{rng.randint(0, 25):02d}:{rng.randint(0, 61):02d}"
+    if kind == 3:
+        return f"{rng.randint(1000, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+    if kind == 4:
+        return f"{rng.choice(['', 'http://', 'https://'])}www.{random_word(rng)}.{rng.choice(['com', 'org', 'x'])}/{random_word(rng)}"
+    if kind == 5:
+        return f"{random_word(rng)}@{random_word(rng)}.{rng.choice(['org', 'it', 'c'])}"
+    if kind == 6:
+        return f"{rng.choice(['', '-', '+'])}{rng.uniform(0, 1000):.{rng.randint(1, 4)}f}".replace(".", rng.choice(".,"))
+    if kind == 7:
+        return f"{rng.choice(['', '-', '+'])}{rng.randint(0, 10 ** 9)}"
+    if kind == 8:
+        return f"{rng.randint(1, 999)}{rng.choice([' ', '-', '–'])}{rng.choice(UNITS)}"
+    if kind == 9:
+        return f"{rng.randint(1900, 2000)}{rng.choice(['-', '–'])}{rng.choice([str(rng.randint(2000, 2023)), 'present', 'now'])}"
+    if kind == 10:
+        return f"{rng.randint(1, 999)}{rng.choice([' ', ',', '.'])}bc"
+    if kind == 11:
+        # digits, separators and letters mixed at random
+        return "".join(rng.choice(string.digits + "-.,:/@ " + "abe") for _ in range(rng.randint(1, 12)))
+    return " ".join(random_word(rng) for _ in range(rng.randint(1, 4)))
+
+
+def test_automaton_matches_the_regex_loop():
+    rng = random.Random(7)
+    cells = [random_cell(rng) for _ in range(20000)]
+    cells += ["", " ", "2020", "24:00", "1997-08-26T24:00", "AUGUST 1997", "1,5 KM", "12 Million", "a@b.co", "x.y"]
+
+    expected = [classify_with_loop(cell) for cell in cells]
+    assert [_classify_uncached(cell) for cell in cells] == expected
+    assert LiteralRecognizer.check_literals(cells) == expected
+    # every branch of the loop is covered by the generated cells
+    assert set(expected) == {key.upper() for key in LiteralRecognizer.literal_types} | {"STRING"}
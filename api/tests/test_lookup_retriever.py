@@ -0,0 +1,141 @@
+import json
+import time
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from model.data_retrievers import lookup_retriever
+from model.data_retrievers.lookup_retriever import LookupRetriever
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.mongo = mongomock.MongoClient()
+        self.mappings = {"wikidata": "wikidata1"}
+
+    def add_mappings_listener(self, listener):
+        pass
+
+    def get_requested_collection(self, collection, kg="wikidata"):
+        return self.mongo["wikidata"][collection]
+
+
+class FakeElastic:
+    # answers every search with the entities whose name is searched; the searches with a timeout
+    # (fallback tiers) take `delay` seconds and return nothing when they do not finish in time
+
+    def __init__(self, entities=(), delay=0):
+        self.entities = list(entities)
+        self.delay = delay
+        self.searches = 0
+
+    def msearch(self, searches, kg="wikidata", timeout=None):
+        self.searches += len(searches)
+        if timeout is not None and self.delay > 0:
+            time.sleep(min(self.delay, timeout))
+            if self.delay > timeout:
+                return [([], {}) for _ in searches]
+        return [(self.hits(body), {}) for body, _, _ in searches]
+
+    def hits(self, body):
+        query = json.dumps(body["query"])
+        found = [entity for entity in self.entities if f'"{entity["name"]}"' in query]
+        return [
+            {
+                "id": entity["id"], "name": entity["name"], "description": "", "types": "Q5", "popularity": 1,
+                "pos_score": round((i + 1) / len(found), 3), "es_score": 1.0, "ntoken_entity": 1, "length_entity": 5,
+            }
+            for i, entity in enumerate(found)
+        ]
+
+
+@pytest.fixture
+def retriever():
+    return LookupRetriever(FakeDatabase(), use_candidate_cache=True)
+
+
+def cached_anywhere(retriever, lookup):
+    return (
+        retriever.l1_cache.get(retriever._l1_key(lookup)) is not None
+        or retriever.candidate_cache.get(lookup) is not None
+        or retriever.negative_cache.contains(lookup)
+    )
+
+
+@pytest.mark.parametrize("create", ["create_query", "create_prefix_query"])
+def test_types_filter_keeps_only_the_qids(retriever, monkeypatch, create):
+    monkeypatch.setattr(lookup_retriever, "LOOKUP_TYPES_FILTER", True)
+
+    typed = getattr(retriever, create)("albert einstein", types="Q5 Scientist Q901")
+    free_text = getattr(retriever, create)("albert einstein", types="Scientist Philosopher Person")
+
+    assert typed["query"]["bool"]["filter"] == [{"terms": {"types.ids": ["Q5", "Q901"]}}]
+    assert "filter" not in free_text["query"]["bool"]
+
+
+def test_lookups_cut_by_the_fallback_budget_are_not_cached(retriever):
+    retriever.elastic_retriever = FakeElastic(delay=0.2)
+    retriever.fallback_budget = 0.05
+
+    result = retriever.search("slowcell", limit=10)
+
+    assert result == {"slowcell": []}
+    assert retriever.get_stats()["fallback"]["budget_exceeded"] == 1
+    lookup = retriever.prepare_lookup("slowcell", limit=10)
+    assert not cached_anywhere(retriever, lookup)
+    assert retriever.database.mongo["wikidata"]["cache"].count_documents({}) == 0
+
+
+def test_batch_lookups_cut_by_the_fallback_budget_are_not_cached(retriever):
+    retriever.elastic_retriever = FakeElastic([{"id": "Q1", "name": "rome"}], delay=0.2)
+    retriever.fallback_budget = 0.05
+
+    result = retriever.search_batch([{"name": "slowcell", "limit": 10}, {"name": "rome", "limit": 10}])
+
+    assert result["slowcell"] == [] and [candidate["id"] for candidate in result["rome"]] == ["Q1"]
+    assert retriever.get_stats()["fallback"]["budget_exceeded"] == 1
+    assert not cached_anywhere(retriever, retriever.prepare_lookup("slowcell", limit=10))
+    assert retriever.candidate_cache.get(retriever.prepare_lookup("rome", limit=10)) is not None
+
+
+def test_fallback_tiers_within_the_budget_are_final(retriever):
+    retriever.elastic_retriever = FakeElastic(delay=0.01)
+    retriever.fallback_budget = 5
+
+    retriever.search("emptycell", limit=10)
+    searches = retriever.elastic_retriever.searches
+    result = retriever.search("emptycell", limit=10)
+
+    assert result == {"emptycell": []}
+    assert retriever.get_stats()["fallback"]["budget_exceeded"] == 0
+    # every tier ran without hits: the second lookup is answered by the negative cache
+    assert retriever.elastic_retriever.searches == searches
+
+
+def test_lookups_with_ids_skip_the_negative_cache(retriever):
+    retriever.elastic_retriever = FakeElastic([{"id": "Q42", "name": "xyzzy"}])
+    # no entity is named xyzzy: only the ids query finds Q42
+    retriever.elastic_retriever.hits = lambda body: (
+        FakeElastic.hits(retriever.elastic_retriever, body) if "Q42" in json.dumps(body) else []
+    )
+
+    assert retriever.search("xyzzy", limit=10) == {"xyzzy": []}
+    searches = retriever.elastic_retriever.searches
+    result = retriever.search("xyzzy", limit=10, ids="Q42")
+
+    assert [candidate["id"] for candidate in result["xyzzy"]] == ["Q42"]
+    assert retriever.elastic_retriever.searches > searches
+
+
+def test_batch_lookups_with_ids_skip_the_negative_cache(retriever):
+    retriever.elastic_retriever = FakeElastic([{"id": "Q42", "name": "xyzzy"}])
+    retriever.elastic_retriever.hits = lambda body: (
+        FakeElastic.hits(retriever.elastic_retriever, body) if "Q42" in json.dumps(body) else []
+    )
+
+    assert retriever.search_batch([{"name": "xyzzy", "limit": 10}]) == {"xyzzy": []}
+    result = retriever.search_batch([{"name": "xyzzy", "limit": 10, "ids": "Q42"}])
+
+    assert [candidate["id"] for candidate in result["xyzzy"]] == ["Q42"]
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from model.negative_cache import NegativeCache
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.mongo = mongomock.MongoClient()
+        self.listeners = []
+
+    def add_mappings_listener(self, listener):
+        self.listeners.append(listener)
+
+    def get_requested_collection(self, collection, kg="wikidata"):
+        return self.mongo["wikidata"][collection]
+
+
+def lookup(cell, limit=100, fuzzy=False):
+    return {"cell": cell, "type": None, "kg": "wikidata", "fuzzy": fuzzy, "limit": limit, "ids": None}
+
+
+def test_empty_lookups_are_known_at_any_limit():
+    cache = NegativeCache(FakeDatabase())
+    cache.add_many([lookup("xyzzy", limit=10)], "wikidata")
+
+    assert cache.contains(lookup("xyzzy", limit=1000))
+    assert not cache.contains(lookup("xyzzy", fuzzy=True))
+    assert sorted(cache.contains_many([lookup("plugh"), lookup("xyzzy")], "wikidata")) == [1]
+
+
+def test_other_workers_read_the_stored_entries():
+    database = FakeDatabase()
+    NegativeCache(database).add(lookup("xyzzy"))
+
+    other = NegativeCache(database)
+
+    assert other.contains(lookup("xyzzy"))
+    assert other.get_stats()["local_entries"] == 1
+
+
+def test_expired_entries_are_not_served():
+    database = FakeDatabase()
+    NegativeCache(database, ttl=60).add(lookup("xyzzy"))
+    # MongoDB removes the expired documents only once a minute
+    database.get_requested_collection("negative_cache").update_many(
+        {}, {"$set": {"createdAt": datetime.utcnow() - timedelta(seconds=120)}}
+    )
+
+    assert not NegativeCache(database, ttl=60).contains(lookup("xyzzy"))
+
+
+def test_switching_database_drops_the_local_entries():
+    database = FakeDatabase()
+    cache = NegativeCache(database)
+    cache.add(lookup("xyzzy"))
+
+    for listener in database.listeners:
+        listener("wikidata", "wikidata1", "wikidata2")
+
+    assert cache.get_stats()["local_entries"] == 0
+    assert cache.get_stats()["invalidations"] == 1
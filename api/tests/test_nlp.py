@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("spacy")
+
+from model.nlp import SPACY_MODEL, NLPPool, pipe_entities
+
+# the pool processes load the real model
+pytest.importorskip(SPACY_MODEL)
+
+TEXTS = ["Barack Obama was born in Honolulu", "Rome is the capital of Italy", ""]
+
+
+def test_pool_processes_give_the_inline_entities():
+    pool = NLPPool(size=1, batch_size=2)
+    try:
+        entities = pool.extract_entities(TEXTS)
+    finally:
+        pool.executor.shutdown()
+
+    assert entities == pipe_entities(TEXTS)
+    assert pool.is_ready()
+    assert pool.get_stats()["submitted"] == 1
+
+
+def test_inline_pool_runs_in_the_worker():
+    pool = NLPPool(size=0)
+
+    assert pool.extract_entities(TEXTS) == pipe_entities(TEXTS)
+    assert pool.get_stats()["inline"] == 1
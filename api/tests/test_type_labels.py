@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from model.data_retrievers.types_retriever import TypesRetriever
+from model.type_labels import TypeLabelRegistry
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.mongo = mongomock.MongoClient()
+        self.mappings = {"wikidata": "wikidata1"}
+        self.listeners = []
+        self.items_queries = 0
+
+    def add_mappings_listener(self, listener):
+        self.listeners.append(listener)
+
+    def get_supported_kgs(self):
+        return ["wikidata"]
+
+    def get_requested_collection(self, collection, kg="wikidata"):
+        if collection == "items":
+            self.items_queries += 1
+        return self.mongo["wikidata1"][collection]
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    database.mongo["wikidata1"]["items"].insert_many([
+        {"entity": "Q5", "category": "type", "labels": {"en": "human"}},
+        {"entity": "Q515", "category": "type", "labels": {"en": "city"}},
+    ])
+    database.mongo["wikidata1"]["types"].insert_one({"entity": "Q90", "types": {"P31": ["Q515"]}})
+    return database
+
+
+def test_types_without_a_loaded_registry_skip_the_labels(database):
+    registry = TypeLabelRegistry(database)
+    # the table is still loading in the background
+    registry._load_async = lambda kg, db_name: None
+
+    for type_label_registry in (None, registry):
+        result = TypesRetriever(database, type_label_registry).get_types_output(["Q90"], "wikidata")
+
+        assert result["wikidata"]["Q90"] == {"types": {"P31": ["Q515"]}}
+    assert database.items_queries == 0
+
+
+def test_types_with_a_loaded_registry_carry_the_labels(database):
+    registry = TypeLabelRegistry(database)
+    registry._load("wikidata", "wikidata1")
+
+    result = TypesRetriever(database, registry).get_types_output(["Q90"], "wikidata")
+
+    assert result["wikidata"]["Q90"]["labels"] == {"Q515": "city"}
+
+
+def test_load_reads_the_mappings_outside_the_registry_lock(database):
+    registry = TypeLabelRegistry(database)
+    locked = []
+
+    class Mappings(dict):
+        def get(self, kg, default=None):
+            # the mappings can wait for the database initialization, which notifies the registry
+            locked.append(registry._lock.locked())
+            return super().get(kg, default)
+
+    database.mappings = Mappings(database.mappings)
+    loader = threading.Thread(target=registry._load, args=("wikidata", "wikidata1"))
+    loader.start()
+    loader.join(5)
+
+    assert locked == [False]
+    assert registry.get_table("wikidata") is not None